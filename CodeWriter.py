@@ -6,30 +6,280 @@ as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
 Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
 """
 import os
+import re
 import typing
 
 
-class CodeWriter:
-    """Translates VM commands into Hack assembly code."""
+class BufferedOutput:
+    """An output stream that collects the written code and passes it on to
+    the underlying stream in large chunks. At most buffer_size characters
+    are held at any time.
+    """
+
+    def __init__(self, output_stream: typing.TextIO,
+                 buffer_size: int = 1 << 16) -> None:
+        """Initializes the buffer.
+
+        Args:
+            output_stream (typing.TextIO): the stream the code is passed on to.
+            buffer_size (int): the number of characters to collect before
+                writing them to the output stream.
+        """
+        self.output_file = output_stream
+        self.buffer_size = buffer_size
+        self.chunks = []
+        self.length = 0
+
+    def write(self, text: str) -> None:
+        """Adds the given text to the buffer.
+
+        Args:
+            text (str): the text to write.
+        """
+        self.chunks.append(text)
+        self.length += len(text)
+        if self.length >= self.buffer_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Writes the whole buffer to the output stream."""
+        if self.chunks:
+            self.output_file.write("".join(self.chunks))
+            self.chunks = []
+            self.length = 0
+
+
+def rom_size(lines: typing.Iterable[str]) -> int:
+    """Counts the ROM words taken by the given assembly code.
 
-    STATIC_COUNTER = 0
+    Args:
+        lines (typing.Iterable[str]): lines of Hack assembly code.
+
+    Returns:
+        int: the number of instructions, labels and comments excluded.
+    """
+    size = 0
+    for line in lines:
+        line = line.strip()
+        if line != "" and not line.startswith("//") \
+                and not line.startswith("("):
+            size += 1
+    return size
+
+
+class CommentFilter:
+    """An output stream that drops the comment lines of the code written to
+    it and passes the rest on."""
+
+    COMMENT_LINE = re.compile(r"^//.*\n", re.MULTILINE)
 
     def __init__(self, output_stream: typing.TextIO) -> None:
+        self.output_file = output_stream
+
+    def write(self, text: str) -> None:
+        self.output_file.write(self.COMMENT_LINE.sub("", text))
+
+
+class CodeStrategy(typing.NamedTuple):
+    """The choices between smaller and faster code that the translator
+    makes for the commands it can translate in more than one way. The
+    defaults translate every command the way it is written.
+    """
+    # write a comment line before the code of every command
+    comments: bool = True
+    # functions with at least this many local variables zero them in a loop
+    # instead of with an instruction pair per variable, 0 for never
+    zero_loop_locals: int = 0
+    # skip the local variable code of functions that have none, and set
+    # ARG = SP-5-n_args with one subtraction instead of n_args+5 decrements
+    compact_frames: bool = False
+    # when the control flow is simplified, copy short loop conditions to the
+    # end of their loops so every iteration takes a single jump
+    rotate_loops: bool = False
+
+
+class TranslationOptions(typing.NamedTuple):
+    """The optimisations the translator applies to every file, see
+    Main.OPTIMIZATION_LEVELS. The defaults translate every command the way
+    it is written.
+    """
+    # calls and returns jump to the shared $CALL and $RETURN routines, which
+    # are written once at the end of the output
+    shared_calls: bool = False
+    # an eq, gt or lt command that is directly followed by an if-goto
+    # command, or by a not command and an if-goto command, is translated
+    # into a single conditional jump
+    fuse_branches: bool = False
+    # arithmetic on constants is folded before it is translated
+    fold_constants: bool = False
+    # the top of the stack is kept in D between commands
+    cache_top: bool = False
+    # SP is only updated before labels, jumps, calls and returns, implies
+    # cache_top
+    defer_sp: bool = False
+    # common sequences of commands are translated by the superinstructions
+    # of Superinstructions.SUPERINSTRUCTIONS
+    superinstructions: bool = False
+    # a call command that is directly followed by a return command reuses
+    # the frame of the current function instead of building a new one
+    tail_calls: bool = False
+    # the control flow of every function is simplified before it is
+    # translated, see ControlFlow.simplify_control_flow
+    simplify_flow: bool = False
+    # the code size and speed choices of the code writer
+    strategy: CodeStrategy = CodeStrategy()
+
+
+class RomCounter:
+    """An output stream that only counts the ROM words written to it."""
+
+    def __init__(self) -> None:
+        self.size = 0
+
+    def write(self, text: str) -> None:
+        self.size += rom_size(text.splitlines())
+
+
+# How far the real stack pointer may get from SP when SP updates are
+# deferred. Stack entries further away take more instructions to address.
+MAX_SP_OFFSET = 2
+
+# The longest address chain the superinstructions use to write a segment
+# entry directly, see CodeWriter.segment_address.
+MAX_ADDRESS_LENGTH = 8
+
+# The push and pop commands whose code write_push_pop builds once per file
+# and reuses: the segments programs address over and over, below this
+# index. Constants are left out, a file can push any of 32768 of them, so
+# the reused code of a file is at most 2 * 7 * 16 entries.
+MEMOIZED_SEGMENTS = ["local", "argument", "this", "that", "temp", "pointer",
+                     "static"]
+MAX_MEMOIZED_INDEX = 16
+
+# The code of the arithmetic commands that do not compare, which never
+# changes, and of the comparisons, where {0} is replaced by the label_id of
+# the command.
+SUB_CODE = "// sub\n" \
+           "@SP\n" \
+           "M=M-1\n" \
+           "A=M\n" \
+           "D=M\n" \
+           "A=A-1\n" \
+           "D=M-D\n" \
+           "M=D\n"
+ARITHMETIC_CODE = {
+    "add": "// add\n"
+           "@SP\n"
+           "M=M-1\n"
+           "A=M\n"
+           "D=M\n"
+           "A=A-1\n"
+           "D=D+M\n"
+           "M=D\n",
+    "sub": SUB_CODE,
+    "neg": "//neq\n"
+           "@SP\n"
+           "A=M-1\n"
+           "M=-M\n",
+    "and": "//and\n"
+           "@SP\n"
+           "M=M-1\n"
+           "A=M\n"
+           "D=M\n"
+           "A=A-1\n"
+           "M=D&M\n",
+    "or": "//or\n"
+          "@SP\n"
+          "M=M-1\n"
+          "A=M\n"
+          "D=M\n"
+          "A=A-1\n"
+          "M=M|D\n",
+    "not": "//not\n"
+           "@SP\n"
+           "A=M-1\n"
+           "M=!M\n",
+}
+COMPARE_TEMPLATES = {
+    command: "//" + command + "\n" + SUB_CODE + "\n"
+             "@" + true_label + "{0}\n"
+             "D;" + jump + "\n"
+             "@SP\n"
+             "A=M\n"
+             "A=A-1\n"
+             "M=0\n"
+             "@" + end_label + "{0}\n"
+             "0;JMP\n"
+             "(" + true_label + "{0})\n"
+             "@SP\n"
+             "A=M\n"
+             "A=A-1\n"
+             "M=-1\n"
+             "(" + end_label + "{0})\n"
+    for command, jump, true_label, end_label in [
+        ("eq", "JEQ", "EQUAL", "EQEND"),
+        ("gt", "JGT", "GREATER", "GREATEREND"),
+        ("lt", "JLT", "LESSTHAN", "LESSTEND")]
+}
+
+
+class CodeWriter:
+    """Translates VM commands into Hack assembly code."""
+
+    def __init__(self, output_stream: typing.TextIO,
+                 shared_calls: bool = False, cache_top: bool = False,
+                 defer_sp: bool = False,
+                 strategy: typing.Optional[CodeStrategy] = None,
+                 record_depths: bool = False) -> None:
         """Initializes the CodeWriter.
 
         Args:
             output_stream (typing.TextIO): output stream.
+            shared_calls (bool): if this is True, "call" and "return" jump to
+                the global $CALL and $RETURN routines instead of inlining the
+                whole frame handling at every site.
+            cache_top (bool): if this is True, the top of the stack is kept
+                in D between push, pop and arithmetic commands, and is only
+                written to the stack before labels, jumps, calls and returns.
+            defer_sp (bool): if this is True, SP is not updated by every
+                push and pop. The writer tracks how far the real stack
+                pointer is from SP, addresses the stack relative to SP and
+                updates SP once before labels, jumps, calls and returns.
+                Implies cache_top.
+            strategy (CodeStrategy): the code size and speed choices,
+                CodeStrategy() by default.
+            record_depths (bool): if this is True, the largest working stack
+                depth of every function is kept in max_stack_depth. Otherwise
+                max_stack_depth is None, so the writer keeps no state for
+                every function it translates.
         """
         # Your code goes here!
         # Note that you can write to output_stream like so:
         # output_stream.write("Hello world! \n")
-        self.cur_static = CodeWriter.STATIC_COUNTER
         self.filename = ""
+        self.strategy = strategy if strategy is not None else CodeStrategy()
         self.output_file = output_stream
-        self.dict = {"static": str(100 + self.cur_static), "local": "LCL", "argument": "ARG", "this": "THIS", "that": "THAT",
+        if not self.strategy.comments:
+            self.output_file = CommentFilter(output_stream)
+        self.dict = {"local": "LCL", "argument": "ARG", "this": "THIS", "that": "THAT",
                      "temp": "5", "pointer": "3", "heap": "2048"}
         self.jump_var = 0
         self.cur_func = ""
+        self.shared_calls = shared_calls
+        self.cache_top = cache_top or defer_sp
+        self.defer_sp = defer_sp
+        # True while the top of the stack is in D instead of RAM[SP]
+        self.top_in_d = False
+        # the real stack pointer minus SP, while SP updates are deferred
+        self.sp_offset = 0
+        # the working stack depth of the current function, and the largest
+        # one of every function, counting the frames pushed by calls, if
+        # they are recorded
+        self.stack_depth = 0
+        self.max_stack_depth = {} if record_depths else None
+        # the code of the push and pop commands of the current file that
+        # are reused, see MEMOIZED_SEGMENTS
+        self.push_pop_code = {}
 
     def set_file_name(self, filename: str) -> None:
         """Informs the code writer that the translation of a new VM file is
@@ -50,6 +300,16 @@ class CodeWriter:
         # For example, using code similar to:
         input_filename, input_extension = os.path.splitext(os.path.basename(filename))
         self.filename = input_filename
+        self.push_pop_code = {}
+
+    def label_id(self) -> str:
+        """
+        Returns:
+            str: the suffix of the labels and variables generated for the
+            current command. It holds the file name, so that every file
+            has its own namespace and files can be translated independently.
+        """
+        return self.filename + "$" + str(self.jump_var)
 
     def write_arithmetic(self, command: str) -> None:
         """Writes assembly code that is the translation of the given
@@ -60,24 +320,16 @@ class CodeWriter:
         Args:
             command (str): an arithmetic command.
         """
-        if command == "add":
-            self.output_file.write(self.write_add())
-        elif command == "sub":
-            self.output_file.write(self.write_sub())
-        elif command == "neg":
-            self.output_file.write(self.write_neg())
-        elif command == "eq":
-            self.output_file.write(self.write_eq())
-        elif command == "gt":
-            self.output_file.write(self.write_gt())
-        elif command == "lt":
-            self.output_file.write(self.write_lt())
-        elif command == "and":
-            self.output_file.write(self.write_and())
-        elif command == "or":
-            self.output_file.write(self.write_or())
-        elif command == "not":
-            self.output_file.write(self.write_not())
+        if command not in ["neg", "not"]:
+            self.track_depth(-1)
+        if self.cache_top:
+            self.output_file.write(self.cached_arithmetic(command))
+        elif command in COMPARE_TEMPLATES:
+            self.jump_var += 1
+            self.output_file.write(
+                COMPARE_TEMPLATES[command].format(self.label_id()))
+        else:
+            self.output_file.write(ARITHMETIC_CODE[command])
 
     def write_push_pop(self, command: str, segment: str, index: int) -> None:
         """Writes assembly code that is the translation of the given
@@ -93,11 +345,84 @@ class CodeWriter:
         # be translated to the assembly symbol "Xxx.i". In the subsequent
         # assembly process, the Hack assembler will allocate these symbolic
         # variables to the RAM, starting at address 16.
+        self.track_depth(1 if command == "C_PUSH" else -1)
+        if not self.cache_top:
+            # the code only depends on the command, so the code of the hot
+            # segments is built once per file and reused
+            key = (command, segment, index)
+            output = self.push_pop_code.get(key)
+            if output is None:
+                output = "// " + command + " " + segment + " " + \
+                         str(index) + "\n"
+                if command == "C_PUSH":
+                    output += self.push_command(segment, index)
+                else:
+                    output += self.pop_command(segment, index)
+                if segment in MEMOIZED_SEGMENTS and \
+                        index < MAX_MEMOIZED_INDEX:
+                    self.push_pop_code[key] = output
+            self.output_file.write(output)
+            return
         output = "// " + command + " " + segment + " " + str(index) + "\n"
         if command == "C_PUSH":
-            output += self.push_command(segment, index)
+            output += self.spill_top() + self.push_value(segment, index)
+            self.top_in_d = True
         else:
-            output += self.pop_command(segment, index)
+            output += self.cached_pop(segment, index)
+        self.output_file.write(output)
+
+    def write_increment(self, segment: str, index: int, amount: int) -> None:
+        """Writes assembly code that adds a constant to a segment entry in
+        place, the translation of "push segment index, push constant amount,
+        add, pop segment index".
+
+        Args:
+            segment (str): a segment whose entry can be addressed directly,
+                see segment_address.
+            index (int): the index in the segment.
+            amount (int): the constant to add, negative to subtract.
+        """
+        self.track_depth(2)
+        self.track_depth(-2)
+        output = "// " + segment + " " + str(index) + " += " + str(amount) + \
+                 "\n" + self.spill_top()
+        address = self.segment_address(segment, index, MAX_ADDRESS_LENGTH)
+        if abs(amount) <= 2:
+            step = "M=M+1\n" if amount > 0 else "M=M-1\n"
+            output += address + step * abs(amount)
+        else:
+            output += "@" + str(abs(amount)) + "\n" \
+                      "D=A\n" + \
+                      address + \
+                      ("M=D+M\n" if amount > 0 else "M=M-D\n")
+        self.output_file.write(output)
+
+    def write_move(self, source_segment: str, source_index: int,
+                   target_segment: str, target_index: int) -> None:
+        """Writes assembly code that copies one segment entry to another,
+        the translation of "push source_segment source_index, pop
+        target_segment target_index".
+
+        Args:
+            source_segment (str): the segment to push from.
+            source_index (int): the index in the source segment.
+            target_segment (str): a segment whose entry can be addressed
+                directly, see segment_address.
+            target_index (int): the index in the target segment.
+        """
+        self.track_depth(1)
+        self.track_depth(-1)
+        output = "// move " + source_segment + " " + str(source_index) + \
+                 " to " + target_segment + " " + str(target_index) + "\n" + \
+                 self.spill_top()
+        address = self.segment_address(target_segment, target_index,
+                                       MAX_ADDRESS_LENGTH)
+        if source_segment == "constant" and source_index in [0, 1]:
+            output += address + "M=" + str(source_index) + "\n"
+        else:
+            output += self.push_value(source_segment, source_index) + \
+                      address + \
+                      "M=D\n"
         self.output_file.write(output)
 
     def write_label(self, label: str) -> None:
@@ -111,7 +436,7 @@ class CodeWriter:
         Args:
             label (str): the label to write.
         """
-        output = "// write label\n"
+        output = "// write label\n" + self.flush_stack()
         if self.cur_func == "":
             output += '(' + label + ')' + "\n"
         else:
@@ -124,7 +449,7 @@ class CodeWriter:
         Args:
             label (str): the label to go to.
         """
-        output = "// write goto\n"
+        output = "// write goto\n" + self.flush_stack()
         if self.cur_func == "":
             output += '@' + label + "\n"
         else:
@@ -138,11 +463,9 @@ class CodeWriter:
         Args:
             label (str): the label to go to.
         """
-        output = "// write if goto\n" \
-                 "@SP\n" \
-                 "M=M-1\n" \
-                 "A=M\n" \
-                 "D=M\n"
+        self.track_depth(-1)
+        output = "// write if goto\n" + self.load_top() + self.commit_sp()
+        self.top_in_d = False
         if self.cur_func == "":
             output += '@' + label + "\nD;JNE\n"
         else:
@@ -150,6 +473,49 @@ class CodeWriter:
         self.output_file.write(output)
 
 
+    def write_compare_if(self, command: str, label: str,
+                         negate: bool = False) -> None:
+        """Writes assembly code that affects an eq, gt or lt command that is
+        directly followed by an if-goto command. Instead of pushing the
+        comparison result and popping it again, the difference of the two
+        operands is tested by a single conditional jump to the label.
+
+        Args:
+            command (str): "eq", "gt" or "lt".
+            label (str): the label of the if-goto command.
+            negate (bool): if this is True, a not command comes between the
+                comparison and the if-goto command, so the jump is taken
+                when the comparison is false.
+        """
+        if negate:
+            jump = {"eq": "JNE", "gt": "JLE", "lt": "JGE"}[command]
+        else:
+            jump = {"eq": "JEQ", "gt": "JGT", "lt": "JLT"}[command]
+        self.track_depth(-2)
+        output = "// " + command + (" not" if negate else "") + \
+                 " if goto\n" + \
+                 self.load_top() + \
+                 self.pop_address() + \
+                 "D=M-D\n" + \
+                 self.commit_sp() + \
+                 "@" + self.label_name(label) + "\n" \
+                 "D;" + jump + "\n"
+        self.top_in_d = False
+        self.output_file.write(output)
+
+    def label_name(self, label: str) -> str:
+        """
+        Args:
+            label (str): a label of a label, goto or if-goto command.
+
+        Returns:
+            str: the label as it appears in the assembly code, which is
+            "function_name$label" inside a function.
+        """
+        if self.cur_func == "":
+            return label
+        return self.cur_func + "$" + label
+
     def write_function(self, function_name: str, n_vars: int) -> None:
         """Writes assembly code that affects the function command. 
         The handling of each "function Xxx.foo" command within the file Xxx.vm
@@ -168,17 +534,35 @@ class CodeWriter:
         # (function_name)       // injects a function entry label into the code
         # repeat n_vars times:  // n_vars = number of local variables
         #   push constant 0     // initializes the local variables to 0
+        output = "// function " + function_name + " " + str(n_vars) + "\n" + \
+                 self.flush_stack()
         self.cur_func = function_name
-        output = "// function " + function_name + " " + str(n_vars)
-        output += "\n(" + function_name + ")\n" \
-                                        "@" + str(n_vars) + "\n" \
-                                                            "D=A\n" \
-                                                            "@SP\n" \
-                                                            "M=M+D\n" \
-                                                            "A=M-D\n"
-        for i in range(n_vars):
-            output += "M=0\n" \
-                      "A=A+1\n"
+        self.stack_depth = 0
+        if self.max_stack_depth is not None:
+            self.max_stack_depth.setdefault(function_name, 0)
+        output += "(" + function_name + ")\n"
+        if 0 < self.strategy.zero_loop_locals <= n_vars:
+            # 9 words, but 7 cycles per variable instead of 2
+            self.jump_var += 1
+            output += "@" + str(n_vars) + "\n" \
+                      "D=A\n" \
+                      "(LOCALS" + self.label_id() + ")\n" \
+                      "@SP\n" \
+                      "AM=M+1\n" \
+                      "A=A-1\n" \
+                      "M=0\n" \
+                      "D=D-1\n" \
+                      "@LOCALS" + self.label_id() + "\n" \
+                      "D;JGT\n"
+        elif n_vars > 0 or not self.strategy.compact_frames:
+            output += "@" + str(n_vars) + "\n" \
+                      "D=A\n" \
+                      "@SP\n" \
+                      "M=M+D\n" \
+                      "A=M-D\n"
+            for i in range(n_vars):
+                output += "M=0\n" \
+                          "A=A+1\n"
         self.output_file.write(output)
 
     def write_call(self, function_name: str, n_args: int) -> None:
@@ -211,9 +595,16 @@ class CodeWriter:
         # (return_address)      // injects the return address label into the code
 
         self.jump_var += 1
+        self.track_depth(5)
+        self.track_depth(-5 - n_args + 1)
+        if self.shared_calls:
+            self.output_file.write(self.flush_stack() +
+                                   self.shared_call(function_name, n_args))
+            return
         # sve return address
-        output = "// Call " + function_name + " " + str(n_args)
-        output += "\n@RETURN" + str(self.jump_var) + function_name + \
+        output = "// Call " + function_name + " " + str(n_args) + "\n" + \
+                 self.flush_stack()
+        output += "@RETURN" + self.label_id() + function_name + \
                   "\nD=A\n" \
                   "@SP\n" \
                   "M=M+1\n" \
@@ -226,14 +617,20 @@ class CodeWriter:
                   "@SP\n" \
                   "D=M\n" \
                   "@LCL\n" \
-                  "M=D\n" \
-                  "@ARG\n" \
                   "M=D\n"
-        for i in range(n_args + 5):
-            output += "M=M-1\n"
+        if self.strategy.compact_frames:
+            output += "@" + str(n_args + 5) + "\n" \
+                      "D=D-A\n" \
+                      "@ARG\n" \
+                      "M=D\n"
+        else:
+            output += "@ARG\n" \
+                      "M=D\n"
+            for i in range(n_args + 5):
+                output += "M=M-1\n"
         output += "@" + function_name + "\n" \
                                         "0;JMP\n" \
-                                        "(RETURN" + str(self.jump_var) + function_name + ")\n"
+                                        "(RETURN" + self.label_id() + function_name + ")\n"
         self.output_file.write(output)
 
     def write_return(self) -> None:
@@ -248,19 +645,22 @@ class CodeWriter:
         # ARG = *(frame-3)              // restores ARG for the caller
         # LCL = *(frame-4)              // restores LCL for the caller
         # goto return_address           // go to the return address
-        self.jump_var += 1
-        output = "// write return " + self.cur_func +  \
-                 "\n@LCL\n" \
+        if self.shared_calls:
+            self.output_file.write("// write return " + self.cur_func +
+                                   "\n" + self.flush_stack() +
+                                   "@$RETURN\n0;JMP\n")
+            return
+        # R13 holds the frame and R14 the return address, like in $RETURN
+        output = "// write return " + self.cur_func + "\n" + \
+                 self.flush_stack() + \
+                 "@LCL\n" \
                  "D=M\n" \
-                 "@FRAME" + str(self.jump_var) + "\n" \
+                 "@R13\n" \
                  "M=D\n" \
                  "@5\n" \
-                 "D=A\n" \
-                 "@FRAME" + str(self.jump_var) + "\n" \
-                 "D=M-D\n" \
-                 "A=D\n" \
+                 "A=D-A\n" \
                  "D=M\n" \
-                 "@RETADDR" + str(self.jump_var) + "\n" \
+                 "@R14\n" \
                  "M=D\n" \
                  "@SP\n" \
                  "A=M-1\n" \
@@ -270,203 +670,481 @@ class CodeWriter:
                  "M=D\n" \
                  "D=A+1\n" \
                  "@SP\n" \
+                 "M=D\n"
+        for segment in ["THAT", "THIS", "ARG", "LCL"]:
+            output += "@R13\n" \
+                      "AM=M-1\n" \
+                      "D=M\n" \
+                      "@" + segment + "\n" \
+                      "M=D\n"
+        output += "@R14\n" \
+                  "A=M\n" \
+                  "0;JMP\n"
+        self.output_file.write(output)
+
+
+
+    def write_tail_call(self, function_name: str, n_args: int) -> None:
+        """Writes assembly code that affects a call command that is directly
+        followed by a return command. Instead of building a new frame, the
+        arguments are moved into the argument segment of the current function
+        and its saved frame is reused, so the callee returns straight to the
+        caller of the current function and the stack does not grow.
+
+        Args:
+            function_name (str): the name of the function to call.
+            n_args (int): the number of arguments of the function.
+        """
+        # The pseudo-code of "call function_name n_args, return" is:
+        # distance = LCL-ARG-n_args-5   // how far the saved frame has to move
+        # if distance < 0:              // it would be overwritten by the
+        #     copy the saved frame above the arguments     // arguments
+        # move the arguments to ARG
+        # if distance != 0:
+        #     move the saved frame (or its copy) right after them
+        #     LCL = ARG+n_args+5
+        # SP = LCL                      // ARG and LCL are the callee's now
+        # goto function_name
+        # R13 and R15 walk over the target and the source of the moves, and
+        # R14 holds the distance.
+        self.jump_var += 1
+        self.track_depth(-n_args)
+        move_word = "@R15\n" \
+                    "AM=M+1\n" \
+                    "D=M\n" \
+                    "@R13\n" \
+                    "AM=M+1\n" \
+                    "M=D\n"
+        output = "// Tail call " + function_name + " " + str(n_args) + \
+                 "\n" + self.flush_stack() + \
+                 "@LCL\n" \
+                 "D=M\n" \
+                 "@ARG\n" \
+                 "D=D-M\n" \
+                 "@" + str(n_args + 5) + "\n" \
+                 "D=D-A\n" \
+                 "@R14\n" \
                  "M=D\n" \
-                 "@FRAME" + str(self.jump_var) + "\n" \
-                 "A=M\n" \
-                 "A=A-1\n" \
+                 "@TAILARGS" + self.label_id() + "\n" \
+                 "D;JGE\n" \
+                 "@LCL\n" \
                  "D=M\n" \
-                 "@THAT\n" \
+                 "@6\n" \
+                 "D=D-A\n" \
+                 "@R13\n" \
                  "M=D\n" \
-                "@FRAME" + str(self.jump_var) + "\n" \
-                 "A=M\n" \
-                 "A=A-1\n" \
-                "A=A-1\n" \
-                "D=M\n" \
-                "@THIS\n" \
-                "M=D\n" \
-                "@FRAME" + str(self.jump_var) + "\n" \
-                 "A=M\n" \
-                 "A=A-1\n" \
-                "A=A-1\n" \
-                "A=A-1\n" \
-                "D=M\n" \
-                "@ARG\n" \
-                "M=D\n" \
-                "@FRAME" + str(self.jump_var) + "\n" \
-                 "A=M\n" \
-                 "A=A-1\n" \
-                "A=A-1\n" \
-                "A=A-1\n" \
-                "A=A-1\n" \
-                "D=M\n" \
-                "@LCL\n" \
-                "M=D\n" \
-                "@RETADDR" + str(self.jump_var) + "\n" \
-                "A=M\n" \
-                "0;JMP\n"
+                 "@SP\n" \
+                 "D=M\n" \
+                 "@R15\n" \
+                 "M=D-1\n"
+        for i in range(5):
+            output += "@R13\n" \
+                      "AM=M+1\n" \
+                      "D=M\n" \
+                      "@R15\n" \
+                      "AM=M+1\n" \
+                      "M=D\n"
+        output += "(TAILARGS" + self.label_id() + ")\n" \
+                  "@SP\n" \
+                  "D=M\n" \
+                  "@" + str(n_args + 1) + "\n" \
+                  "D=D-A\n" \
+                  "@R15\n" \
+                  "M=D\n" \
+                  "@ARG\n" \
+                  "D=M\n" \
+                  "@R13\n" \
+                  "M=D-1\n" + \
+                  move_word * n_args + \
+                  "@R14\n" \
+                  "D=M\n" \
+                  "@TAILJUMP" + self.label_id() + "\n" \
+                  "D;JEQ\n" \
+                  "@TAILFRAME" + self.label_id() + "\n" \
+                  "D;JLT\n" \
+                  "@LCL\n" \
+                  "D=M\n" \
+                  "@6\n" \
+                  "D=D-A\n" \
+                  "@R15\n" \
+                  "M=D\n" \
+                  "(TAILFRAME" + self.label_id() + ")\n" + \
+                  move_word * 5 + \
+                  "@R13\n" \
+                  "D=M+1\n" \
+                  "@LCL\n" \
+                  "M=D\n" \
+                  "(TAILJUMP" + self.label_id() + ")\n" \
+                  "@LCL\n" \
+                  "D=M\n" \
+                  "@SP\n" \
+                  "M=D\n" \
+                  "@" + function_name + "\n" \
+                  "0;JMP\n"
+        self.output_file.write(output)
+
+    def shared_call(self, function_name, n_args):
+        # R13 = callee, R14 = n_args, D = return address, then jump to $CALL
+        output = "// Call " + function_name + " " + str(n_args) + \
+                 "\n@" + function_name + "\n" \
+                 "D=A\n" \
+                 "@R13\n" \
+                 "M=D\n"
+        if n_args in [0, 1]:
+            output += "@R14\n" \
+                      "M=" + str(n_args) + "\n"
+        else:
+            output += "@" + str(n_args) + "\n" \
+                      "D=A\n" \
+                      "@R14\n" \
+                      "M=D\n"
+        output += "@RETURN" + self.label_id() + function_name + "\n" \
+                  "D=A\n" \
+                  "@$CALL\n" \
+                  "0;JMP\n" \
+                  "(RETURN" + self.label_id() + function_name + ")\n"
+        return output
+
+    def write_shared_routines(self) -> None:
+        """Writes the global $CALL and $RETURN routines used when the writer
+        was created with shared_calls. Should be written once per output file,
+        after all of the translated code.
+        """
+        # Code that runs off the end of the program must not fall into the
+        # routines, so it is caught by an infinite loop first.
+        output = "($HALT)\n" \
+                 "@$HALT\n" \
+                 "0;JMP\n"
+        # $CALL expects the return address in D, the callee in R13 and n_args
+        # in R14. It saves the caller's frame, repositions ARG and LCL and
+        # jumps to the callee.
+        output += "// shared call routine\n" \
+                  "($CALL)\n" \
+                  "@SP\n" \
+                  "A=M\n" \
+                  "M=D\n"
+        for segment in ["LCL", "ARG", "THIS", "THAT"]:
+            output += "@" + segment + "\n" \
+                      "D=M\n" \
+                      "@SP\n" \
+                      "AM=M+1\n" \
+                      "M=D\n"
+        output += "@SP\n" \
+                  "MD=M+1\n" \
+                  "@LCL\n" \
+                  "M=D\n" \
+                  "@R14\n" \
+                  "D=D-M\n" \
+                  "@5\n" \
+                  "D=D-A\n" \
+                  "@ARG\n" \
+                  "M=D\n" \
+                  "@R13\n" \
+                  "A=M\n" \
+                  "0;JMP\n"
+        # $RETURN keeps the frame in R13 and the return address in R14.
+        output += "// shared return routine\n" \
+                  "($RETURN)\n" \
+                  "@LCL\n" \
+                  "D=M\n" \
+                  "@R13\n" \
+                  "M=D\n" \
+                  "@5\n" \
+                  "A=D-A\n" \
+                  "D=M\n" \
+                  "@R14\n" \
+                  "M=D\n" \
+                  "@SP\n" \
+                  "AM=M-1\n" \
+                  "D=M\n" \
+                  "@ARG\n" \
+                  "A=M\n" \
+                  "M=D\n" \
+                  "D=A+1\n" \
+                  "@SP\n" \
+                  "M=D\n"
+        for segment in ["THAT", "THIS", "ARG", "LCL"]:
+            output += "@R13\n" \
+                      "AM=M-1\n" \
+                      "D=M\n" \
+                      "@" + segment + "\n" \
+                      "M=D\n"
+        output += "@R14\n" \
+                  "A=M\n" \
+                  "0;JMP\n"
         self.output_file.write(output)
 
+    def segment_address(self, segment: str, index: int,
+                        max_length: int) -> typing.Optional[str]:
+        """Selects the addressing mode of a segment entry. Statics, temp and
+        pointer have fixed addresses, and small indices into local,
+        argument, this and that are reached by stepping A up from the base.
+
+        Args:
+            segment (str): a segment other than constant.
+            index (int): the index in the segment.
+            max_length (int): the most instructions the code may take.
 
+        Returns:
+            typing.Optional[str]: code that points A at the entry without
+            changing D, or None if that takes more than max_length
+            instructions and the address has to be computed in D.
+        """
+        if segment == "static":
+            return "@" + self.filename + "." + str(index) + "\n"
+        if segment in ["temp", "pointer"]:
+            return "@" + str(int(self.dict[segment]) + index) + "\n"
+        if max(index + 1, 2) > max_length:
+            return None
+        output = "@" + self.dict[segment] + "\n"
+        if index == 0:
+            return output + "A=M\n"
+        return output + "A=M+1\n" + "A=A+1\n" * (index - 1)
 
-    def write_add(self):
-        return "// add\n" \
+    def push_command(self, segment, index):
+        return self.push_value(segment, index) + \
                "@SP\n" \
-               "M=M-1\n" \
                "A=M\n" \
-               "D=M\n" \
-               "A=A-1\n" \
-               "D=D+M\n" \
-               "M=D\n"
+               "M=D\n" \
+               "@SP\n" \
+               "M=M+1\n"
+
+    def push_value(self, segment: str, index: int) -> str:
+        """
+        Args:
+            segment (str): the memory segment to push from.
+            index (int): the index in the memory segment.
 
-    # THIS IS A TEST
+        Returns:
+            str: code that loads the value to push into D.
+        """
+        if segment == "constant" and index in [0, 1]:
+            output = "D=" + str(index) + "\n"
+        elif segment == "constant":
+            output = "@" + str(index) + "\nD=A\n"
+        else:
+            # computing the address in D takes 4 instructions
+            output = self.segment_address(segment, index, 4)
+            if output is None:
+                output = "@" + str(index) + "\n" \
+                         "D=A\n" \
+                         "@" + self.dict[segment] + "\n" \
+                         "A=D+M\n"
+            output += "D=M\n"
+        return output
 
-    def write_sub(self):
-        return "// sub\n" \
+    def pop_command(self, segment, index):
+        if segment == "constant":
+            return "@SP\n" \
+                   "M=M-1\n"
+        # computing the address in D and keeping it in R13 while the value
+        # is popped takes 9 instructions, 4 more than a direct address
+        address = self.segment_address(segment, index, 8)
+        if address is not None:
+            return "@SP\n" \
+                   "AM=M-1\n" \
+                   "D=M\n" + \
+                   address + \
+                   "M=D\n"
+        return "@" + self.dict[segment] + "\n" \
+               "D=M\n" \
+               "@" + str(index) + "\n" \
+               "D=D+A\n" \
+               "@R13\n" \
+               "M=D\n" \
                "@SP\n" \
-               "M=M-1\n" \
-               "A=M\n" \
+               "AM=M-1\n" \
                "D=M\n" \
-               "A=A-1\n" \
-               "D=M-D\n" \
+               "@R13\n" \
+               "A=M\n" \
                "M=D\n"
 
-    def write_neg(self):
-        return "//neq\n" \
-               "@SP\n" \
-               "A=M-1\n" \
-               "M=-M\n"
+    def cached_pop(self, segment: str, index: int) -> str:
+        """
+        Args:
+            segment (str): the memory segment to pop to.
+            index (int): the index in the memory segment.
 
-    def write_eq(self):
-        self.jump_var += 1
-        return "//eq\n" \
-               + self.write_sub() \
-               + "\n" + \
-               "@EQUAL" + str(self.jump_var) + "\n" \
-                                               "D;JEQ\n" \
-                                               "@SP\n" \
-                                               "A=M\n" \
-                                               "A=A-1\n" \
-                                               "M=0\n" \
-                                               "@EQEND" + str(self.jump_var) + "\n" \
-                                                                               "0;JMP\n" \
-                                                                               "(EQUAL" + str(self.jump_var) + ")\n" \
-                                                                                                               "@SP\n" \
-                                                                                                               "A=M\n" \
-                                                                                                               "A=A-1\n" \
-                                                                                                               "M=-1\n" \
-                                                                                                               "(EQEND" + str(
-            self.jump_var) + ")\n"
-
-    def write_gt(self):
-        self.jump_var += 1
-        return "//gt\n" \
-               + self.write_sub() \
-               + "\n" + \
-               "@GREATER" + str(self.jump_var) + "\n" \
-                                                 "D;JGT\n" \
-                                                 "@SP\n" \
-                                                 "A=M\n" \
-                                                 "A=A-1\n" \
-                                                 "M=0\n" \
-                                                 "@GREATEREND" + str(self.jump_var) + "\n" \
-                                                                                      "0;JMP\n" \
-                                                                                      "(GREATER" + str(
-            self.jump_var) + ")\n" \
-                             "@SP\n" \
-                             "A=M\n" \
-                             "A=A-1\n" \
-                             "M=-1\n" \
-                             "(GREATEREND" + str(self.jump_var) + ")\n"
-
-    def write_lt(self):
-        self.jump_var += 1
-        return "//lt\n" \
-               + self.write_sub() \
-               + "\n" + \
-               "@LESSTHAN" + str(self.jump_var) + "\n" \
-                                                  "D;JLT\n" \
-                                                  "@SP\n" \
-                                                  "A=M\n" \
-                                                  "A=A-1\n" \
-                                                  "M=0\n" \
-                                                  "@LESSTEND" + str(self.jump_var) + "\n" \
-                                                                                     "0;JMP\n" \
-                                                                                     "(LESSTHAN" + str(
-            self.jump_var) + ")\n" \
-                             "@SP\n" \
-                             "A=M\n" \
-                             "A=A-1\n" \
-                             "M=-1\n" \
-                             "(LESSTEND" + str(self.jump_var) + ")\n"
-
-    def write_and(self):
-        self.jump_var += 1
-        return "//and\n" \
-               "@SP\n" \
-               "M=M-1\n" \
-               "A=M\n" \
+        Returns:
+            str: code that pops the top of the stack when the stack top is
+            cached in D.
+        """
+        if segment == "constant":
+            if self.top_in_d:
+                self.top_in_d = False
+                return ""
+            if self.defer_sp:
+                self.sp_offset -= 1
+                return ""
+            return self.pop_command(segment, index)
+        if not self.top_in_d and not self.defer_sp:
+            return self.pop_command(segment, index)
+        output = self.load_top()
+        self.top_in_d = False
+        # computing the address while the value is kept in R13 takes 10
+        # instructions, 9 more than a direct address
+        address = self.segment_address(segment, index, 10)
+        if address is not None:
+            return output + address + "M=D\n"
+        return output + \
+               "@R13\n" \
+               "M=D\n" \
+               "@" + self.dict[segment] + "\n" \
                "D=M\n" \
-               "A=A-1\n" \
-               "M=D&M\n"
-
-    def write_or(self):
-        return "//or\n" + \
-               "@SP\n" \
-               "M=M-1\n" \
-               "A=M\n" \
+               "@" + str(index) + "\n" \
+               "D=D+A\n" \
+               "@R14\n" \
+               "M=D\n" \
+               "@R13\n" \
                "D=M\n" \
-               "A=A-1\n" \
-               "M=M|D\n"
+               "@R14\n" \
+               "A=M\n" \
+               "M=D\n"
 
-    def write_not(self):
-        return "//not\n" \
-               "@SP\n" \
-               "A=M-1\n" \
-               "M=!M\n" \
+    def cached_arithmetic(self, command: str) -> str:
+        """
+        Args:
+            command (str): an arithmetic command.
 
-    def push_command(self, segment, index):
-        output = "@" + str(index) + "\nD=A\n"
-        if segment in ["static", "pointer", "temp"]:
-            output += "@" + self.dict[segment] + \
-                      "\nA=D+A\n" + \
-                      "D=M\n"
-        elif segment in self.dict:
-            output += "@" + self.dict[segment] + "\nA=M\n" + "A=D+A\n" \
-                                                             "D=M\n"
-        output += "@SP\n" \
-                  "A=M\n" \
-                  "M=D\n" \
-                  "@SP\n" \
-                  "M=M+1\n"
+        Returns:
+            str: code that applies the command to the top of the stack, and
+            leaves the result in D.
+        """
+        output = "// " + command + "\n" + self.load_top()
+        if command in ["neg", "not"]:
+            output += "D=" + {"neg": "-", "not": "!"}[command] + "D\n"
+        elif command in ["eq", "gt", "lt"]:
+            self.jump_var += 1
+            output += self.pop_address() + \
+                      "D=M-D\n" \
+                      "@TRUE" + self.label_id() + "\n" \
+                      "D;J" + command.upper() + "\n" \
+                      "D=0\n" \
+                      "@TRUEEND" + self.label_id() + "\n" \
+                      "0;JMP\n" \
+                      "(TRUE" + self.label_id() + ")\n" \
+                      "D=-1\n" \
+                      "(TRUEEND" + self.label_id() + ")\n"
+        else:
+            output += self.pop_address() + \
+                      "D=" + {"add": "D+M", "sub": "M-D", "and": "D&M",
+                              "or": "D|M"}[command] + "\n"
+        self.top_in_d = True
         return output
 
-    def pop_command(self, segment, index):
-        self.jump_var += 1
-        if segment == "constant":
+    def load_top(self) -> str:
+        """
+        Returns:
+            str: code that pops the top of the stack into D, or nothing if
+            it is already cached there. Afterwards the top is in D.
+        """
+        if self.top_in_d:
+            return ""
+        self.top_in_d = True
+        return self.pop_address() + "D=M\n"
+
+    def pop_address(self) -> str:
+        """
+        Returns:
+            str: code that removes the top entry of the stack in RAM and
+            points A at it, without changing D.
+        """
+        if not self.defer_sp:
             return "@SP\n" \
-                   "M=M-1\n"
-        output = "@" + self.dict[segment]
-        if segment in ["temp", "static", "pointer"]:
-            if segment == "static":
-                CodeWriter.STATIC_COUNTER += 1
-            output += "\nD=A\n"
-        else:
-            output += "\nD=M\n"
-        output += "@TAR" + str(self.jump_var) + "\n" \
-                                                "M=D\n" \
-                                                "@" + str(index) + \
-                  "\nD=A\n" \
-                  "@TAR" + str(self.jump_var) + "\n" \
-                                                "M=D+M\n" \
-                                                "@SP\n" \
-                                                "M=M-1\n" \
-                                                "A=M\n" \
-                                                "D=M\n" \
-                                                "@TAR" + str(self.jump_var) + "\n" \
-                                                                              "A=M\n" \
-                                                                              "M=D\n"
+                   "AM=M-1\n"
+        output = ""
+        if self.sp_offset <= -MAX_SP_OFFSET:
+            output = self.commit_sp()
+        self.sp_offset -= 1
+        return output + self.stack_slot(self.sp_offset)
+
+    def stack_slot(self, offset: int) -> str:
+        """
+        Args:
+            offset (int): the distance of a stack entry from SP.
+
+        Returns:
+            str: code that points A at RAM[SP + offset] without changing D.
+        """
+        if offset == 0:
+            return "@SP\n" \
+                   "A=M\n"
+        if offset > 0:
+            return "@SP\n" \
+                   "A=M+1\n" + "A=A+1\n" * (offset - 1)
+        return "@SP\n" \
+               "A=M-1\n" + "A=A-1\n" * (-offset - 1)
+
+    def commit_sp(self) -> str:
+        """
+        Returns:
+            str: code that moves SP to the real top of the stack without
+            changing D, or nothing if it is already there.
+        """
+        if self.sp_offset == 0:
+            return ""
+        step = "M=M+1\n" if self.sp_offset > 0 else "M=M-1\n"
+        output = "@SP\n" + step * abs(self.sp_offset)
+        self.sp_offset = 0
         return output
 
+    def flush_stack(self) -> str:
+        """
+        Returns:
+            str: code that writes the cached top of the stack to RAM and
+            updates SP, so the stack is in RAM as the VM defines it.
+        """
+        if self.top_in_d and self.sp_offset >= 0:
+            # the top goes right above the real stack top, and pushing it
+            # with SP is cheaper than addressing it and then moving SP
+            output = self.commit_sp()
+            self.top_in_d = False
+            return output + \
+                "@SP\n" \
+                "M=M+1\n" \
+                "A=M-1\n" \
+                "M=D\n"
+        return self.spill_top() + self.commit_sp()
+
+    def track_depth(self, change: int) -> None:
+        """Records a change of the working stack depth of the current
+        function.
+
+        Args:
+            change (int): the number of entries pushed, negative if popped.
+        """
+        if self.max_stack_depth is None:
+            return
+        self.stack_depth += change
+        if self.stack_depth > self.max_stack_depth.get(self.cur_func, 0):
+            self.max_stack_depth[self.cur_func] = self.stack_depth
+
+    def spill_top(self) -> str:
+        """
+        Returns:
+            str: code that writes the top of the stack from D to the stack,
+            or nothing if it is not cached there.
+        """
+        if not self.top_in_d:
+            return ""
+        self.top_in_d = False
+        if self.defer_sp:
+            output = ""
+            if self.sp_offset >= MAX_SP_OFFSET:
+                output = self.commit_sp()
+            self.sp_offset += 1
+            return output + self.stack_slot(self.sp_offset - 1) + "M=D\n"
+        return "@SP\n" \
+               "M=M+1\n" \
+               "A=M-1\n" \
+               "M=D\n"
+
+    def write_spill(self) -> None:
+        """Writes the top of the stack to the stack if it is cached in D,
+        and updates SP if its updates were deferred. Should be called after
+        the last command of a file."""
+        self.output_file.write(self.flush_stack())
+
     def save(self, segment):
         return "@" + segment + "\n" \
                                "D=M\n" \
@@ -0,0 +1,181 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import typing
+from Parser import Command
+
+# The 16 bit result of every arithmetic command on unsigned operands. gt and
+# lt are computed the way the translated code computes them: from the sign
+# of x-y with 16 bit wraparound, which is not the signed order of x and y
+# when x-y overflows.
+BINARY_OPERATIONS = {
+    "add": lambda x, y: (x + y) & 65535,
+    "sub": lambda x, y: (x - y) & 65535,
+    "and": lambda x, y: x & y,
+    "or": lambda x, y: x | y,
+    "eq": lambda x, y: 65535 if x == y else 0,
+    "gt": lambda x, y: 65535 if 0 < (x - y) & 65535 < 32768 else 0,
+    "lt": lambda x, y: 65535 if (x - y) & 65535 >= 32768 else 0,
+}
+UNARY_OPERATIONS = {
+    "neg": lambda x: -x & 65535,
+    "not": lambda x: x ^ 65535,
+}
+
+# The right operands that leave the left operand of a command unchanged.
+IDENTITIES = {"add": 0, "sub": 0, "or": 0, "and": 65535}
+
+# The most commands that are held back because they may still be folded
+# with the commands that follow them.
+MAX_WINDOW = 64
+
+
+def constant_commands(value: int, line: int) -> typing.List[Command]:
+    """
+    Args:
+        value (int): an unsigned 16 bit value.
+        line (int): the line number of the new commands.
+
+    Returns:
+        typing.List[Command]: commands that push the value. push constant
+        only takes values up to 32767, so larger values are pushed as the
+        not of a constant.
+    """
+    if value < 32768:
+        return [Command("C_PUSH", "constant", value, line)]
+    return [Command("C_PUSH", "constant", value ^ 65535, line),
+            Command("C_ARITHMETIC", "not", 0, line)]
+
+
+def constant_before(window: typing.List[Command],
+                    end: int) -> typing.Optional[typing.Tuple[int, int]]:
+    """
+    Args:
+        window (typing.List[Command]): the commands.
+        end (int): the index after the last command to look at.
+
+    Returns:
+        typing.Optional[typing.Tuple[int, int]]: the value and the number of
+        commands of the constant that ends right before end, or None if
+        there is none. A constant is a push constant, optionally followed
+        by not or neg.
+    """
+    if end >= 1 and window[end - 1].type == "C_PUSH" and \
+            window[end - 1].arg1 == "constant":
+        return window[end - 1].arg2, 1
+    if end >= 2 and window[end - 1].type == "C_ARITHMETIC" and \
+            window[end - 1].arg1 in UNARY_OPERATIONS and \
+            window[end - 2].type == "C_PUSH" and \
+            window[end - 2].arg1 == "constant":
+        operation = UNARY_OPERATIONS[window[end - 1].arg1]
+        return operation(window[end - 2].arg2), 2
+    return None
+
+
+def simplify(window: typing.List[Command]) -> bool:
+    """Folds the last command of the window with the commands before it.
+
+    Args:
+        window (typing.List[Command]): the commands, changed in place.
+
+    Returns:
+        bool: True if the window was changed.
+    """
+    last = window[-1]
+    if last.type != "C_ARITHMETIC":
+        return False
+    end = len(window) - 1
+    operand = constant_before(window, end)
+    if last.arg1 in UNARY_OPERATIONS:
+        if operand is not None:
+            value, length = operand
+            folded = constant_commands(UNARY_OPERATIONS[last.arg1](value),
+                                       last.line)
+            if [command[:3] for command in folded] == \
+                    [command[:3] for command in window[end - length:]]:
+                # this is already the shortest way to push the value
+                return False
+            window[end - length:] = folded
+            return True
+        # not not and neg neg cancel out
+        if end >= 1 and window[end - 1].type == "C_ARITHMETIC" and \
+                window[end - 1].arg1 == last.arg1:
+            del window[end - 1:]
+            return True
+        return False
+    if operand is None:
+        return False
+    value, length = operand
+    left = constant_before(window, end - length)
+    if left is not None:
+        left_value, left_length = left
+        window[end - length - left_length:] = constant_commands(
+            BINARY_OPERATIONS[last.arg1](left_value, value), last.line)
+        return True
+    if IDENTITIES.get(last.arg1) == value:
+        del window[end - length:]
+        return True
+    return False
+
+
+def fold_statistics() -> typing.Dict[str, int]:
+    """
+    Returns:
+        typing.Dict[str, int]: zero counts for fold_commands.
+    """
+    return {"commands": 0, "kept": 0}
+
+
+def fold_report(statistics: typing.Dict[str, int]) -> str:
+    """
+    Returns:
+        str: the changes counted by fold_commands.
+    """
+    return "Constant folding removed " + \
+           str(statistics["commands"] - statistics["kept"]) + " of " + \
+           str(statistics["commands"]) + " VM commands"
+
+
+def fold_commands(
+        commands: typing.Iterable[Command],
+        statistics: typing.Optional[typing.Dict[str, int]] = None
+) -> typing.Iterator[Command]:
+    """Folds arithmetic on constants into a single push, and removes
+    arithmetic that does not change its operand: x+0, x-0, x|0, x&-1, not not
+    and neg neg. All arithmetic is done with 16 bit wraparound, like the Hack
+    CPU does it.
+
+    Commands are only combined with the commands that come directly before
+    them, and any command other than a push constant or an arithmetic
+    command ends the window, so labels and jumps are never folded across.
+
+    Args:
+        commands (typing.Iterable[Command]): the commands of a file.
+        statistics (typing.Dict[str, int]): if given, counts the commands
+            that were read and kept, see fold_statistics.
+
+    Returns:
+        typing.Iterator[Command]: the folded commands.
+    """
+    if statistics is None:
+        statistics = fold_statistics()
+    window = []
+    for command in commands:
+        statistics["commands"] += 1
+        window.append(command)
+        while window and simplify(window):
+            pass
+        if command.type not in ["C_PUSH", "C_ARITHMETIC"] or \
+                (command.type == "C_PUSH" and command.arg1 != "constant"):
+            statistics["kept"] += len(window)
+            yield from window
+            window = []
+        elif len(window) > MAX_WINDOW:
+            statistics["kept"] += 1
+            yield window.pop(0)
+    statistics["kept"] += len(window)
+    yield from window
@@ -0,0 +1,366 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import typing
+from Parser import Command
+
+# Loop conditions with more commands than this are not copied to the end of
+# their loop by rotate_loops.
+MAX_ROTATED_COMMANDS = 6
+
+# The commands whose result is always true (-1) or false (0).
+COMPARISONS = ["eq", "gt", "lt"]
+
+
+class BasicBlock:
+    """A sequence of commands of a function that is only entered at its
+    start and only left at its end.
+
+    Attributes:
+        labels (typing.List[str]): the labels of the start of the block.
+        commands (typing.List[Command]): the commands of the block, none of
+            which is a label, goto, if-goto or return command.
+        jump (typing.Optional[Command]): the goto, if-goto or return command
+            that ends the block, or None if it falls through to the next one.
+    """
+
+    def __init__(self, labels: typing.Optional[typing.List[str]] = None
+                 ) -> None:
+        self.labels = labels if labels is not None else []
+        self.commands = []
+        self.jump = None
+
+    def falls_through(self) -> bool:
+        """
+        Returns:
+            bool: True if the block can continue with the block after it.
+        """
+        return self.jump is None or self.jump.type == "C_IF"
+
+    def target(self) -> typing.Optional[str]:
+        """
+        Returns:
+            typing.Optional[str]: the label the block jumps to, if any.
+        """
+        if self.jump is not None and self.jump.type in ["C_GOTO", "C_IF"]:
+            return self.jump.arg1
+        return None
+
+    def is_empty(self) -> bool:
+        return not self.labels and not self.commands and self.jump is None
+
+
+def build_blocks(commands: typing.List[Command]) -> typing.List[BasicBlock]:
+    """
+    Args:
+        commands (typing.List[Command]): the commands of a function, without
+            its function command.
+
+    Returns:
+        typing.List[BasicBlock]: the basic blocks of the commands, in order.
+        Consecutive labels start a single block.
+    """
+    blocks = [BasicBlock()]
+    for command in commands:
+        block = blocks[-1]
+        if command.type == "C_LABEL":
+            if block.commands:
+                block = BasicBlock()
+                blocks.append(block)
+            block.labels.append(command.arg1)
+        elif command.type in ["C_GOTO", "C_IF", "C_RETURN"]:
+            block.jump = command
+            blocks.append(BasicBlock())
+        else:
+            block.commands.append(command)
+    if len(blocks) > 1 and blocks[-1].is_empty():
+        blocks.pop()
+    return blocks
+
+
+def label_blocks(blocks: typing.List[BasicBlock]) -> typing.Dict[str, int]:
+    """
+    Returns:
+        typing.Dict[str, int]: the index of the block of every label.
+    """
+    return {label: index for index, block in enumerate(blocks)
+            for label in block.labels}
+
+
+def thread_jumps(blocks: typing.List[BasicBlock],
+                 statistics: typing.Dict[str, int]) -> None:
+    """Makes every jump to an empty block that only jumps on, or falls
+    through to a labeled block, jump to the final destination instead."""
+    labels = label_blocks(blocks)
+    for block in blocks:
+        target = block.target()
+        if target is None:
+            continue
+        seen = {target}
+        while target in labels:
+            index = labels[target]
+            destination = blocks[index]
+            if destination.commands:
+                break
+            if destination.jump is not None and \
+                    destination.jump.type == "C_GOTO":
+                next_target = destination.jump.arg1
+            elif destination.jump is None and index + 1 < len(blocks) and \
+                    blocks[index + 1].labels:
+                next_target = blocks[index + 1].labels[0]
+            else:
+                break
+            if next_target in seen:
+                break
+            seen.add(next_target)
+            target = next_target
+        if target != block.target():
+            block.jump = Command(block.jump.type, target, 0, block.jump.line)
+            statistics["threaded"] += 1
+
+
+def remove_unreachable(blocks: typing.List[BasicBlock],
+                       statistics: typing.Dict[str, int]
+                       ) -> typing.List[BasicBlock]:
+    """
+    Returns:
+        typing.List[BasicBlock]: the blocks that can be reached from the
+        start of the function, in the same order.
+    """
+    labels = label_blocks(blocks)
+    reached = set()
+    pending = [0]
+    while pending:
+        index = pending.pop()
+        if index in reached or index >= len(blocks):
+            continue
+        reached.add(index)
+        block = blocks[index]
+        if block.falls_through():
+            pending.append(index + 1)
+        if block.target() in labels:
+            pending.append(labels[block.target()])
+    for index, block in enumerate(blocks):
+        if index not in reached:
+            statistics["unreachable"] += len(block.commands) + \
+                (block.jump is not None)
+    return [block for index, block in enumerate(blocks) if index in reached]
+
+
+def inverted_condition(commands: typing.List[Command]
+                       ) -> typing.Optional[typing.List[Command]]:
+    """
+    Args:
+        commands (typing.List[Command]): commands that push a condition.
+
+    Returns:
+        typing.Optional[typing.List[Command]]: commands that push the
+        opposite condition, or None if it is not known to be a boolean. Only
+        comparisons, optionally followed by not, are inverted.
+    """
+    last = commands[-1]
+    if last.type == "C_ARITHMETIC" and last.arg1 == "not" and \
+            len(commands) >= 2 and commands[-2].type == "C_ARITHMETIC" and \
+            commands[-2].arg1 in COMPARISONS:
+        return commands[:-1]
+    if last.type == "C_ARITHMETIC" and last.arg1 in COMPARISONS:
+        return commands + [Command("C_ARITHMETIC", "not", 0, last.line)]
+    return None
+
+
+def rotate_loops(blocks: typing.List[BasicBlock],
+                 statistics: typing.Dict[str, int]) -> None:
+    """Copies the condition of a loop to the end of its body, so every
+    iteration takes a single conditional jump back instead of a jump to the
+    condition and a conditional jump out of the loop.
+
+    A block that ends with a goto to a short condition block, which exits
+    the loop with an if-goto and falls through to the loop body, ends with
+    the inverted condition and an if-goto to the body instead. This is only
+    done when the block is directly followed by the exit of the loop.
+    """
+    labels = label_blocks(blocks)
+    for index, block in enumerate(blocks[:-1]):
+        if block.jump is None or block.jump.type != "C_GOTO" or \
+                block.target() not in labels:
+            continue
+        head_index = labels[block.target()]
+        head = blocks[head_index]
+        if head.jump is None or head.jump.type != "C_IF" or \
+                not head.commands or \
+                len(head.commands) > MAX_ROTATED_COMMANDS or \
+                head_index + 1 >= len(blocks) or \
+                head.target() not in blocks[index + 1].labels:
+            continue
+        condition = inverted_condition(head.commands)
+        if condition is None:
+            continue
+        body = blocks[head_index + 1]
+        if not body.labels:
+            body.labels.append(head.labels[0] + "$body")
+        line = block.jump.line
+        block.commands += [Command(command.type, command.arg1, command.arg2,
+                                   line) for command in condition]
+        block.jump = Command("C_IF", body.labels[0], 0, line)
+        statistics["rotated"] += 1
+
+
+def layout(blocks: typing.List[BasicBlock],
+           statistics: typing.Dict[str, int]) -> typing.List[BasicBlock]:
+    """Orders the blocks so that as many gotos as possible jump to the block
+    right after them, and removes those gotos.
+
+    Blocks that fall through stay together with the block after them, so
+    the blocks are moved in chains. After a chain that ends with a goto, the
+    chain it jumps to is placed if it was not placed yet, otherwise the
+    first chain that was not placed. A chain that falls off the end of the
+    function stays last.
+
+    Returns:
+        typing.List[BasicBlock]: the blocks in their new order.
+    """
+    chains = []
+    for block in blocks:
+        if chains and chains[-1][-1].falls_through():
+            chains[-1].append(block)
+        else:
+            chains.append([block])
+    heads = {label: index for index, chain in enumerate(chains)
+             for label in chain[0].labels}
+    last = len(chains) - 1 if chains[-1][-1].falls_through() else None
+    placed = [False] * len(chains)
+    order = []
+    index = 0
+    while index is not None:
+        placed[index] = True
+        order.append(chains[index])
+        end = chains[index][-1]
+        index = heads.get(end.target()) \
+            if end.jump is not None and end.jump.type == "C_GOTO" else None
+        if index is None or placed[index] or index == last:
+            index = next((other for other in range(len(chains))
+                          if not placed[other] and other != last), None)
+        if index is None and last is not None and not placed[last]:
+            index = last
+    ordered = [block for chain in order for block in chain]
+    for block, following in zip(ordered, ordered[1:]):
+        if block.jump is not None and block.jump.type == "C_GOTO" and \
+                block.target() in following.labels:
+            block.jump = None
+            statistics["gotos"] += 1
+    return ordered
+
+
+def prune_labels(blocks: typing.List[BasicBlock],
+                 statistics: typing.Dict[str, int]) -> None:
+    """Removes the labels that no jump uses."""
+    used = {block.target() for block in blocks}
+    for block in blocks:
+        kept = [label for label in block.labels if label in used]
+        statistics["labels"] += len(block.labels) - len(kept)
+        block.labels = kept
+
+
+def block_commands(blocks: typing.List[BasicBlock]) -> typing.List[Command]:
+    """
+    Returns:
+        typing.List[Command]: the commands of the blocks, in order.
+    """
+    commands = []
+    for block in blocks:
+        line = block.commands[0].line if block.commands else \
+            block.jump.line if block.jump is not None else 0
+        commands += [Command("C_LABEL", label, 0, line)
+                     for label in block.labels]
+        commands += block.commands
+        if block.jump is not None:
+            commands.append(block.jump)
+    return commands
+
+
+def simplify_function(commands: typing.List[Command], rotate: bool,
+                      statistics: typing.Dict[str, int]
+                      ) -> typing.List[Command]:
+    """
+    Args:
+        commands (typing.List[Command]): the commands of a function, without
+            its function command.
+        rotate (bool): if this is True, loop conditions are rotated.
+        statistics (typing.Dict[str, int]): counts the changes.
+
+    Returns:
+        typing.List[Command]: the simplified commands.
+    """
+    blocks = build_blocks(commands)
+    thread_jumps(blocks, statistics)
+    blocks = remove_unreachable(blocks, statistics)
+    if rotate:
+        rotate_loops(blocks, statistics)
+    blocks = layout(blocks, statistics)
+    prune_labels(blocks, statistics)
+    return block_commands(blocks)
+
+
+def new_statistics() -> typing.Dict[str, int]:
+    """
+    Returns:
+        typing.Dict[str, int]: zero counts for simplify_control_flow.
+    """
+    return {"threaded": 0, "gotos": 0, "unreachable": 0, "labels": 0,
+            "rotated": 0}
+
+
+def statistics_report(statistics: typing.Dict[str, int]) -> str:
+    """
+    Returns:
+        str: the changes counted by simplify_control_flow.
+    """
+    return "Control flow: " + str(statistics["threaded"]) + \
+           " jumps threaded, " + str(statistics["gotos"]) + \
+           " gotos removed, " + str(statistics["unreachable"]) + \
+           " unreachable commands removed, " + str(statistics["labels"]) + \
+           " unused labels removed, " + str(statistics["rotated"]) + \
+           " loops rotated"
+
+
+def simplify_control_flow(
+        commands: typing.Iterable[Command], rotate: bool = False,
+        statistics: typing.Optional[typing.Dict[str, int]] = None
+) -> typing.Iterator[Command]:
+    """Simplifies the control flow of every function: jumps to jumps are
+    threaded, unreachable code is removed, the blocks are ordered so that
+    gotos can fall through instead, and unused labels are removed.
+
+    Functions are simplified one at a time, as soon as their last command
+    is read. Commands outside of any function are left as they are, since
+    their labels are global.
+
+    Args:
+        commands (typing.Iterable[Command]): the commands of a file.
+        rotate (bool): if this is True, the conditions of loops are also
+            copied to the end of their bodies, see rotate_loops.
+        statistics (typing.Dict[str, int]): if given, counts the changes,
+            see new_statistics.
+
+    Returns:
+        typing.Iterator[Command]: the simplified commands.
+    """
+    if statistics is None:
+        statistics = new_statistics()
+    body = None
+    for command in commands:
+        if command.type == "C_FUNCTION":
+            if body is not None:
+                yield from simplify_function(body, rotate, statistics)
+            yield command
+            body = []
+        elif body is None:
+            yield command
+        else:
+            body.append(command)
+    if body is not None:
+        yield from simplify_function(body, rotate, statistics)
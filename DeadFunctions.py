@@ -0,0 +1,115 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import typing
+from Parser import Command
+
+# A whole program: the path of every input file and its parsed commands.
+Program = typing.List[typing.Tuple[str, typing.List[Command]]]
+
+
+def split_functions(
+        commands: typing.List[Command]
+) -> typing.List[typing.Tuple[str, typing.List[Command]]]:
+    """Splits the commands of a file at its function commands.
+
+    Args:
+        commands (typing.List[Command]): the commands of a file.
+
+    Returns:
+        typing.List[typing.Tuple[str, typing.List[Command]]]: the name and
+        the commands of every function, in order. Commands that come before
+        the first function are returned under the name "".
+    """
+    functions = []
+    name = ""
+    body = []
+    for command in commands:
+        if command.type == "C_FUNCTION":
+            if body or name != "":
+                functions.append((name, body))
+            name = command.arg1
+            body = []
+        body.append(command)
+    if body or name != "":
+        functions.append((name, body))
+    return functions
+
+
+def call_graph(program: Program) -> typing.Dict[str, typing.Set[str]]:
+    """
+    Args:
+        program (Program): the program.
+
+    Returns:
+        typing.Dict[str, typing.Set[str]]: the functions called by every
+        function. Calls made outside of any function are listed under "".
+    """
+    graph = {}
+    for input_path, commands in program:
+        for name, body in split_functions(commands):
+            callees = graph.setdefault(name, set())
+            for command in body:
+                if command.type == "C_CALL":
+                    callees.add(command.arg1)
+    return graph
+
+
+def reachable_functions(program: Program,
+                        entry: str = "Sys.init") -> typing.Set[str]:
+    """
+    Args:
+        program (Program): the program.
+        entry (str): the function the bootstrap code calls.
+
+    Returns:
+        typing.Set[str]: the functions that can be called, directly or
+        indirectly, from the entry function or from code outside of any
+        function.
+    """
+    graph = call_graph(program)
+    reached = set()
+    pending = [entry, ""]
+    while pending:
+        name = pending.pop()
+        if name in reached:
+            continue
+        reached.add(name)
+        pending.extend(graph.get(name, ()))
+    return reached
+
+
+def eliminate_dead_functions(
+        program: Program, entry: str = "Sys.init"
+) -> typing.Tuple[Program, typing.List[typing.Tuple[str, str,
+                                                     typing.List[Command]]]]:
+    """Removes the functions that can never be called. If the program does
+    not define the entry function, nothing is removed.
+
+    Args:
+        program (Program): the program.
+        entry (str): the function the bootstrap code calls.
+
+    Returns:
+        typing.Tuple[Program, typing.List]: the program without the dead
+        functions, and the path, name and commands of every removed function.
+    """
+    graph = call_graph(program)
+    if entry not in graph:
+        return program, []
+    reached = reachable_functions(program, entry)
+    live_program = []
+    removed = []
+    for input_path, commands in program:
+        live_commands = []
+        for name, body in split_functions(commands):
+            if name in reached:
+                live_commands.extend(body)
+            else:
+                removed.append((input_path, name, body))
+        live_program.append((input_path, live_commands))
+    return live_program, removed
@@ -0,0 +1,387 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import argparse
+import os
+import re
+import time
+import typing
+
+PREDEFINED_SYMBOLS = {"SP": 0, "LCL": 1, "ARG": 2, "THIS": 3, "THAT": 4,
+                      "SCREEN": 16384, "KBD": 24576}
+for _register in range(16):
+    PREDEFINED_SYMBOLS["R" + str(_register)] = _register
+
+RAM_SIZE = 32768
+
+# The Python expression computing every comp field. Registers hold unsigned
+# 16 bit values, a, d and m are the A register, the D register and RAM[A].
+COMP_EXPRESSIONS = {
+    "0": "0", "1": "1", "-1": "65535",
+    "D": "d", "A": "a", "M": "m",
+    "!D": "d ^ 65535", "!A": "a ^ 65535", "!M": "m ^ 65535",
+    "-D": "-d & 65535", "-A": "-a & 65535", "-M": "-m & 65535",
+    "D+1": "(d + 1) & 65535", "A+1": "(a + 1) & 65535",
+    "M+1": "(m + 1) & 65535",
+    "D-1": "(d - 1) & 65535", "A-1": "(a - 1) & 65535",
+    "M-1": "(m - 1) & 65535",
+    "D+A": "(d + a) & 65535", "D+M": "(d + m) & 65535",
+    "D-A": "(d - a) & 65535", "D-M": "(d - m) & 65535",
+    "A-D": "(a - d) & 65535", "M-D": "(m - d) & 65535",
+    "D&A": "d & a", "D&M": "d & m", "D|A": "d | a", "D|M": "d | m",
+}
+# the operands of +, & and | may also be written the other way around
+for _comp, _expression in list(COMP_EXPRESSIONS.items()):
+    if len(_comp) == 3 and _comp[1] in "+&|":
+        COMP_EXPRESSIONS[_comp[2] + _comp[1] + _comp[0]] = _expression
+
+# The Python condition of every jump field, v is the computed value.
+JUMP_CONDITIONS = {"JGT": "0 < v < 32768", "JEQ": "v == 0",
+                   "JGE": "v < 32768", "JLT": "v >= 32768",
+                   "JNE": "v != 0", "JLE": "v == 0 or v >= 32768",
+                   "JMP": "True"}
+
+
+class Instruction(typing.NamedTuple):
+    """A decoded Hack instruction. An A-instruction has a value, a
+    C-instruction has dest, comp and jump fields ("" when missing)."""
+    value: typing.Optional[int]
+    dest: str
+    comp: str
+    jump: str
+
+
+class HackProgram:
+    """An assembled Hack program.
+
+    Attributes:
+        instructions (typing.List[Instruction]): the ROM, one decoded
+            instruction per word.
+        labels (typing.Dict[str, int]): the ROM address of every label.
+        variables (typing.Dict[str, int]): the RAM address the assembler
+            gave every variable, starting at 16.
+    """
+
+    def __init__(self, instructions: typing.List[Instruction],
+                 labels: typing.Dict[str, int],
+                 variables: typing.Dict[str, int]) -> None:
+        self.instructions = instructions
+        self.labels = labels
+        self.variables = variables
+
+
+class Assembler:
+    """Assembles Hack assembly code that is given a line at a time. Every
+    instruction is decoded when its line is added, and the symbols are
+    resolved once the whole program is known.
+    """
+
+    def __init__(self) -> None:
+        self.instructions = []
+        self.labels = {}
+        # the address and symbol of every A-instruction with a symbol
+        self.references = []
+
+    def add_line(self, line: str) -> None:
+        """Adds a line of assembly code.
+
+        Args:
+            line (str): the line, which may hold a comment or nothing at all.
+        """
+        comment_index = line.find("//")
+        if comment_index != -1:
+            line = line[:comment_index]
+        line = line.strip()
+        if line == "":
+            return
+        if line.startswith("("):
+            label = line[1:-1]
+            if label in self.labels:
+                raise ValueError("Label " + label + " is defined twice")
+            self.labels[label] = len(self.instructions)
+        elif line.startswith("@"):
+            symbol = line[1:]
+            if not symbol.isdigit():
+                self.references.append((len(self.instructions), symbol))
+                symbol = "0"
+            self.instructions.append(Instruction(int(symbol), "", "", ""))
+        else:
+            dest, comp, jump = "", line, ""
+            if "=" in comp:
+                dest, comp = comp.split("=", 1)
+            if ";" in comp:
+                comp, jump = comp.split(";", 1)
+            if comp not in COMP_EXPRESSIONS or \
+                    (jump != "" and jump not in JUMP_CONDITIONS):
+                raise ValueError("Invalid instruction " + line)
+            self.instructions.append(Instruction(None, dest, comp, jump))
+
+    def program(self) -> HackProgram:
+        """
+        Returns:
+            HackProgram: the program, with every symbol resolved. Variables
+            get their RAM addresses in the order they are first used.
+        """
+        instructions = list(self.instructions)
+        variables = {}
+        for address, symbol in self.references:
+            if symbol in self.labels:
+                value = self.labels[symbol]
+            elif symbol in PREDEFINED_SYMBOLS:
+                value = PREDEFINED_SYMBOLS[symbol]
+            else:
+                if symbol not in variables:
+                    variables[symbol] = 16 + len(variables)
+                value = variables[symbol]
+            instructions[address] = Instruction(value, "", "", "")
+        return HackProgram(instructions, dict(self.labels), variables)
+
+
+def assemble(lines: typing.Iterable[str]) -> HackProgram:
+    """Assembles Hack assembly code with the usual two passes: the first
+    decodes every instruction and collects the labels, the second resolves
+    the symbols.
+
+    Args:
+        lines (typing.Iterable[str]): lines of Hack assembly code.
+
+    Returns:
+        HackProgram: the assembled program.
+    """
+    assembler = Assembler()
+    for line in lines:
+        assembler.add_line(line)
+    return assembler.program()
+
+
+class HackEmulator:
+    """Runs a Hack program, one cycle per instruction.
+
+    The ROM is decoded once by assemble. Every straight run of instructions
+    that ends in a jump is compiled into a Python function the first time
+    the program reaches it, and these functions are kept in a table indexed
+    by their start address, so the emulator never decodes text while it
+    runs. A program halts when it reaches the usual infinite loop
+    "(END) @END 0;JMP" or leaves the ROM.
+    """
+
+    def __init__(self, program: HackProgram) -> None:
+        """Loads the program, with all registers and RAM set to 0.
+
+        Args:
+            program (HackProgram): the program to run.
+        """
+        self.program = program
+        self.ram = [0] * RAM_SIZE
+        self.pc = 0
+        self.a = 0
+        self.d = 0
+        self.cycles = 0
+        self.halted = False
+        size = len(program.instructions)
+        # the compiled block starting at every address and its length
+        self.blocks = [None] * size
+        self.steps = [None] * size
+        self.halt_addresses = set()
+        for address in range(size - 1):
+            instruction = program.instructions[address]
+            following = program.instructions[address + 1]
+            if instruction.value == address and following.jump == "JMP" \
+                    and following.dest == "":
+                self.halt_addresses.add(address)
+
+    def compile(self, address: int, single: bool = False) -> tuple:
+        """Compiles the instructions starting at the given address, up to and
+        including the first jump.
+
+        Args:
+            address (int): the address of the first instruction.
+            single (bool): if this is True, only the first instruction is
+                compiled.
+
+        Returns:
+            tuple: the compiled function and the number of instructions.
+            The function takes the RAM, D and A and returns the next address,
+            D and A.
+        """
+        instructions = self.program.instructions
+        body = []
+        end = address
+        while end < len(instructions):
+            instruction = instructions[end]
+            end += 1
+            if instruction.value is not None:
+                body.append("a = " + str(instruction.value))
+            else:
+                expression = COMP_EXPRESSIONS[instruction.comp]
+                if "m" in expression:
+                    body.append("m = ram[a]")
+                body.append("v = " + expression)
+                if instruction.jump != "":
+                    body.append("t = a")
+                if "M" in instruction.dest:
+                    body.append("ram[a] = v")
+                if "A" in instruction.dest:
+                    body.append("a = v")
+                if "D" in instruction.dest:
+                    body.append("d = v")
+                if instruction.jump != "":
+                    body.append("if " + JUMP_CONDITIONS[instruction.jump] +
+                                ": return t, d, a")
+                    break
+            if single:
+                break
+        body.append("return " + str(end) + ", d, a")
+        source = "def block(ram, d, a):\n    " + "\n    ".join(body) + "\n"
+        namespace = {}
+        exec(source, namespace)
+        return namespace["block"], end - address
+
+    def run(self, max_cycles: int) -> int:
+        """Runs the program until it halts or max_cycles cycles have passed
+        since it was loaded.
+
+        Args:
+            max_cycles (int): the total number of cycles to run at most.
+
+        Returns:
+            int: the number of cycles that passed since the program was loaded.
+        """
+        ram = self.ram
+        blocks = self.blocks
+        halt_addresses = self.halt_addresses
+        size = len(blocks)
+        pc, d, a, cycles = self.pc, self.d, self.a, self.cycles
+        while cycles < max_cycles:
+            if pc >= size or pc in halt_addresses:
+                self.halted = True
+                break
+            block = blocks[pc]
+            if block is None:
+                block = blocks[pc] = self.compile(pc)
+            if cycles + block[1] > max_cycles:
+                block = self.steps[pc]
+                if block is None:
+                    block = self.steps[pc] = self.compile(pc, True)
+            pc, d, a = block[0](ram, d, a)
+            cycles += block[1]
+        self.pc, self.d, self.a, self.cycles = pc, d, a, cycles
+        return cycles
+
+
+def to_signed(value: int) -> int:
+    """
+    Args:
+        value (int): an unsigned 16 bit value.
+
+    Returns:
+        int: the value as a 16 bit two's complement number.
+    """
+    return value - 65536 if value >= 32768 else value
+
+
+def load_test(tst_path: str, asm_path: typing.Optional[str] = None
+              ) -> typing.Tuple[HackEmulator, int]:
+    """Loads the program of a CPUEmulator test script and sets the RAM
+    values the script sets. Only the commands used by the nand2tetris VM
+    tests are supported: load, set RAM[i] and repeat n { ticktock; }.
+
+    Args:
+        tst_path (str): path of the .tst script.
+        asm_path (str): the program to load, by default the one the script
+            loads.
+
+    Returns:
+        typing.Tuple[HackEmulator, int]: the loaded emulator and the number
+        of cycles the script runs it for.
+    """
+    with open(tst_path, 'r') as tst_file:
+        script = re.sub(r"//.*", "", tst_file.read())
+    if asm_path is None:
+        load = re.search(r"load\s+([^,;\s]+)", script)
+        asm_path = os.path.join(os.path.dirname(tst_path), load.group(1))
+    with open(asm_path, 'r') as asm_file:
+        emulator = HackEmulator(assemble(asm_file))
+    for address, value in re.findall(r"set\s+RAM\[(\d+)\]\s+(-?\d+)", script):
+        emulator.ram[int(address)] = int(value) & 65535
+    cycles = sum(int(count) for count in re.findall(r"repeat\s+(\d+)",
+                                                    script))
+    return emulator, cycles
+
+
+def run_test(tst_path: str, asm_path: typing.Optional[str] = None
+             ) -> typing.Tuple[HackEmulator, typing.List[str]]:
+    """Runs a CPUEmulator test script and compares the RAM with its .cmp file.
+    Only a single output of RAM values is supported, see load_test for the
+    other commands.
+
+    Args:
+        tst_path (str): path of the .tst script.
+        asm_path (str): the program to run, by default the one the script
+            loads.
+
+    Returns:
+        typing.Tuple[HackEmulator, typing.List[str]]: the emulator after the
+        run and a description of every RAM value that does not match.
+    """
+    emulator, cycles = load_test(tst_path, asm_path)
+    emulator.run(cycles)
+    with open(os.path.splitext(tst_path)[0] + ".cmp", 'r') as cmp_file:
+        rows = [line for line in cmp_file.read().splitlines() if line.strip()]
+    names = [name.strip() for name in rows[0].strip().strip("|").split("|")]
+    values = [value.strip() for value in rows[1].strip().strip("|").split("|")]
+    mismatches = []
+    for name, value in zip(names, values):
+        address = int(re.match(r"RAM\[(\d+)\]", name).group(1))
+        actual = to_signed(emulator.ram[address])
+        if actual != int(value):
+            mismatches.append(name + ": expected " + value + ", got " +
+                              str(actual))
+    return emulator, mismatches
+
+
+if "__main__" == __name__:
+    arg_parser = argparse.ArgumentParser(prog="HackEmulator")
+    arg_parser.add_argument(
+        "paths", nargs="+",
+        help=".tst scripts to check against their .cmp files, or .asm "
+             "programs to run")
+    arg_parser.add_argument(
+        "--cycles", type=int, default=10000000,
+        help="the number of cycles to run an .asm program for at most")
+    arg_parser.add_argument(
+        "--ram", default="0-15",
+        help="the RAM range printed after running an .asm program")
+    args = arg_parser.parse_args()
+    failed = False
+    for path in args.paths:
+        start = time.perf_counter()
+        if path.endswith(".tst"):
+            emulator, mismatches = run_test(path)
+            seconds = time.perf_counter() - start
+            print(path + ": " + ("FAIL" if mismatches else "OK") + ", " +
+                  str(emulator.cycles) + " cycles, " +
+                  str(int(emulator.cycles / max(seconds, 1e-9))) +
+                  " cycles per second")
+            for mismatch in mismatches:
+                print("    " + mismatch)
+            failed = failed or bool(mismatches)
+            continue
+        with open(path, 'r') as asm_file:
+            emulator = HackEmulator(assemble(asm_file))
+        emulator.run(args.cycles)
+        seconds = time.perf_counter() - start
+        print(path + ": " + str(emulator.cycles) + " cycles" +
+              (", halted" if emulator.halted else "") + ", " +
+              str(int(emulator.cycles / max(seconds, 1e-9))) +
+              " cycles per second")
+        first, last = [int(part) for part in args.ram.split("-")]
+        for address in range(first, last + 1):
+            print("RAM[" + str(address) + "] = " +
+                  str(to_signed(emulator.ram[address])))
+    if failed:
+        raise SystemExit(1)
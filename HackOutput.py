@@ -0,0 +1,122 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import typing
+from HackEmulator import Assembler, HackProgram, Instruction
+
+# The a bit and the c bits of every comp field.
+COMP_CODES = {
+    "0": 0b0101010, "1": 0b0111111, "-1": 0b0111010,
+    "D": 0b0001100, "A": 0b0110000, "M": 0b1110000,
+    "!D": 0b0001101, "!A": 0b0110001, "!M": 0b1110001,
+    "-D": 0b0001111, "-A": 0b0110011, "-M": 0b1110011,
+    "D+1": 0b0011111, "A+1": 0b0110111, "M+1": 0b1110111,
+    "D-1": 0b0001110, "A-1": 0b0110010, "M-1": 0b1110010,
+    "D+A": 0b0000010, "D+M": 0b1000010,
+    "D-A": 0b0010011, "D-M": 0b1010011,
+    "A-D": 0b0000111, "M-D": 0b1000111,
+    "D&A": 0b0000000, "D&M": 0b1000000, "D|A": 0b0010101, "D|M": 0b1010101,
+}
+# the operands of +, & and | may also be written the other way around
+for _comp, _code in list(COMP_CODES.items()):
+    if len(_comp) == 3 and _comp[1] in "+&|":
+        COMP_CODES[_comp[2] + _comp[1] + _comp[0]] = _code
+
+DEST_BITS = {"A": 0b100, "D": 0b010, "M": 0b001}
+
+JUMP_CODES = {"": 0, "JGT": 1, "JEQ": 2, "JGE": 3, "JLT": 4, "JNE": 5,
+              "JLE": 6, "JMP": 7}
+
+
+def encode(instruction: Instruction) -> int:
+    """
+    Args:
+        instruction (Instruction): a decoded instruction.
+
+    Returns:
+        int: the 16 bit machine code of the instruction.
+    """
+    if instruction.value is not None:
+        if instruction.value > 32767:
+            raise ValueError("The value " + str(instruction.value) +
+                             " does not fit in an A-instruction")
+        return instruction.value
+    dest = 0
+    for register in instruction.dest:
+        dest |= DEST_BITS[register]
+    return 0b1110000000000000 | COMP_CODES[instruction.comp] << 6 | \
+        dest << 3 | JUMP_CODES[instruction.jump]
+
+
+class AssemblingOutput:
+    """An output stream that assembles the code written to it in memory,
+    so a translated program never has to be written out as text and parsed
+    again. The text can still be passed on to another stream, like the
+    .asm file.
+    """
+
+    def __init__(self, output_stream: typing.Optional[typing.TextIO] = None
+                 ) -> None:
+        """Initializes the output.
+
+        Args:
+            output_stream (typing.TextIO): if given, the written code is also
+                written to this stream.
+        """
+        self.output_stream = output_stream
+        self.assembler = Assembler()
+        # the end of the last write, if it did not end a line
+        self.partial_line = ""
+
+    def write(self, text: str) -> None:
+        """Assembles the lines of the given text.
+
+        Args:
+            text (str): the code to write.
+        """
+        if self.output_stream is not None:
+            self.output_stream.write(text)
+        lines = (self.partial_line + text).split("\n")
+        self.partial_line = lines.pop()
+        for line in lines:
+            self.assembler.add_line(line)
+
+    def program(self) -> HackProgram:
+        """
+        Returns:
+            HackProgram: the program written so far, with every symbol
+            resolved.
+        """
+        if self.partial_line:
+            self.assembler.add_line(self.partial_line)
+            self.partial_line = ""
+        return self.assembler.program()
+
+
+def write_hack(program: HackProgram, output_file: typing.TextIO) -> None:
+    """Writes a program in the .hack format: one line of 16 binary digits per
+    instruction.
+
+    Args:
+        program (HackProgram): the program.
+        output_file (typing.TextIO): the .hack file.
+    """
+    output_file.write("".join(format(encode(instruction), "016b") + "\n"
+                              for instruction in program.instructions))
+
+
+def write_rom_image(program: HackProgram,
+                    output_file: typing.BinaryIO) -> None:
+    """Writes a program as a raw ROM image: two bytes per instruction, most
+    significant byte first.
+
+    Args:
+        program (HackProgram): the program.
+        output_file (typing.BinaryIO): the image file, opened in binary mode.
+    """
+    output_file.write(b"".join(encode(instruction).to_bytes(2, "big")
+                               for instruction in program.instructions))
@@ -0,0 +1,227 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import os
+import typing
+from Parser import Command
+from DeadFunctions import Program, split_functions
+
+# The ROM words taken by the translation of commands of the given file.
+RomMeasure = typing.Callable[[str, typing.List[Command]], int]
+
+
+def stack_change(command: Command) -> int:
+    """
+    Args:
+        command (Command): a command that is not a return command.
+
+    Returns:
+        int: the number of values the command adds to the working stack.
+    """
+    if command.type == "C_PUSH":
+        return 1
+    if command.type in ["C_POP", "C_IF"]:
+        return -1
+    if command.type == "C_ARITHMETIC":
+        return 0 if command.arg1 in ["neg", "not"] else -1
+    if command.type == "C_CALL":
+        return 1 - command.arg2
+    return 0
+
+
+def inline_problem(body: typing.List[Command], n_args: int,
+                   same_file: bool) -> typing.Optional[str]:
+    """
+    Args:
+        body (typing.List[Command]): the commands of the callee, starting
+            with its function command.
+        n_args (int): the number of arguments of the call.
+        same_file (bool): if this is True, the callee is in the file of the
+            caller.
+
+    Returns:
+        typing.Optional[str]: why the callee can not be inlined at the call,
+        or None if it can.
+    """
+    n_locals = body[0].arg2
+    if body[-1].type not in ["C_RETURN", "C_GOTO"]:
+        return "it does not end with a return"
+    # the working stack has to be empty at every label and jump, and hold
+    # only the return value at every return, so that every path leaves the
+    # same stack behind
+    depth = 0
+    for command in body[1:]:
+        if command.type in ["C_PUSH", "C_POP"]:
+            if command.arg1 == "argument" and command.arg2 >= n_args:
+                return "it uses argument " + str(command.arg2) + \
+                       " and is called with " + str(n_args)
+            if command.arg1 == "local" and command.arg2 >= n_locals:
+                return "it uses local " + str(command.arg2) + " of " + \
+                       str(n_locals)
+            if command.arg1 == "static" and not same_file:
+                return "it uses the statics of another file"
+        if command.type == "C_CALL" and command.arg1 == body[0].arg1:
+            return "it is recursive"
+        if command.type == "C_RETURN":
+            if depth != 1:
+                return "the stack is not balanced at a return"
+            depth = 0
+            continue
+        depth += stack_change(command)
+        if depth < 0:
+            return "it pops values it did not push"
+        if command.type in ["C_LABEL", "C_GOTO", "C_IF"]:
+            if depth != 0:
+                return "the stack is not empty at a label or jump"
+            if command.type == "C_GOTO":
+                depth = 0
+    return None
+
+
+def inline_call(body: typing.List[Command], call: Command, base: int,
+                site: int) -> typing.Tuple[typing.List[Command], int]:
+    """Translates a call of a function into VM commands that do the work
+    of the function in the frame of the caller.
+
+    The arguments and the locals of the callee are kept in new local
+    variables of the caller, starting at base, as are the pointers the
+    callee changes, which are restored after it is done. Labels are renamed
+    into "callee$label.site", so every inlined copy has its own labels.
+
+    Args:
+        body (typing.List[Command]): the commands of the callee, starting
+            with its function command. inline_problem must accept it.
+        call (Command): the call command.
+        base (int): the first free local variable of the caller.
+        site (int): a number that is unique to the call in the caller.
+
+    Returns:
+        typing.Tuple[typing.List[Command], int]: the commands, and the number
+        of local variables of the caller they use.
+    """
+    callee, n_locals = body[0].arg1, body[0].arg2
+    n_args, line = call.arg2, call.line
+    saved_pointers = sorted({command.arg2 for command in body
+                             if command.type == "C_POP" and
+                             command.arg1 == "pointer"})
+    saved_base = base + n_args + n_locals
+    # labels can not start with a digit, so this is not a renamed label
+    end_label = callee + "$" + str(site)
+    commands = [Command("C_POP", "local", base + i, line)
+                for i in reversed(range(n_args))]
+    for i, pointer in enumerate(saved_pointers):
+        commands += [Command("C_PUSH", "pointer", pointer, line),
+                     Command("C_POP", "local", saved_base + i, line)]
+    for i in range(n_locals):
+        commands += [Command("C_PUSH", "constant", 0, line),
+                     Command("C_POP", "local", base + n_args + i, line)]
+    jumps_to_end = False
+    for index, command in enumerate(body[1:], 1):
+        if command.type in ["C_PUSH", "C_POP"] and \
+                command.arg1 in ["argument", "local"]:
+            offset = base if command.arg1 == "argument" else base + n_args
+            command = Command(command.type, "local", offset + command.arg2,
+                              line)
+        elif command.type in ["C_LABEL", "C_GOTO", "C_IF"]:
+            command = Command(command.type, callee + "$" + command.arg1 +
+                              "." + str(site), 0, line)
+        elif command.type == "C_RETURN":
+            if index == len(body) - 1:
+                continue
+            command = Command("C_GOTO", end_label, 0, line)
+            jumps_to_end = True
+        else:
+            command = Command(command.type, command.arg1, command.arg2, line)
+        commands.append(command)
+    if jumps_to_end:
+        commands.append(Command("C_LABEL", end_label, 0, line))
+    for i, pointer in enumerate(saved_pointers):
+        commands += [Command("C_PUSH", "local", saved_base + i, line),
+                     Command("C_POP", "pointer", pointer, line)]
+    return commands, n_args + n_locals + len(saved_pointers)
+
+
+def inline_functions(
+        program: Program, measure: RomMeasure, max_commands: int = 8,
+        rom_budget: typing.Optional[int] = None
+) -> typing.Tuple[Program, typing.List[str]]:
+    """Replaces calls of small functions with the commands of the functions.
+    Only the bodies of the functions as they are written are inlined, so a
+    function that is inlined into another one is not inlined again with it.
+
+    Args:
+        program (Program): the program.
+        measure (RomMeasure): returns the ROM words taken by the translation
+            of commands, used to keep to the ROM budget.
+        max_commands (int): functions with more commands than this, not
+            counting their function command, are never inlined.
+        rom_budget (typing.Optional[int]): the most words of ROM the inlined
+            calls may add to the program, or None for no limit.
+
+    Returns:
+        typing.Tuple[Program, typing.List[str]]: the program with the calls
+        inlined, and a line describing the decision made for every call of a
+        small function.
+    """
+    functions = {}
+    for input_path, commands in program:
+        for name, body in split_functions(commands):
+            if name != "":
+                functions[name] = (input_path, body)
+    decisions = []
+    growth = 0
+    inlined_program = []
+    for input_path, commands in program:
+        inlined_commands = []
+        for name, body in split_functions(commands):
+            if name == "":
+                inlined_commands.extend(body)
+                continue
+            n_locals = body[0].arg2
+            extra_locals = 0
+            new_body = [body[0]]
+            for command in body[1:]:
+                callee = functions.get(command.arg1) \
+                    if command.type == "C_CALL" else None
+                if callee is None or command.arg1 == name or \
+                        len(callee[1]) - 1 > max_commands:
+                    new_body.append(command)
+                    continue
+                callee_path, callee_body = callee
+                where = command.arg1 + " into " + name + " (" + \
+                    os.path.basename(input_path) + ":" + \
+                    str(command.line) + ")"
+                problem = inline_problem(callee_body, command.arg2,
+                                         callee_path == input_path)
+                if problem is not None:
+                    decisions.append("Not inlined " + where + ": " + problem)
+                    new_body.append(command)
+                    continue
+                inlined, used_locals = inline_call(
+                    callee_body, command, n_locals, len(decisions))
+                needed_locals = max(extra_locals, used_locals)
+                change = measure(input_path, inlined) - \
+                    measure(input_path, [command]) + \
+                    measure(input_path, [Command(
+                        "C_FUNCTION", name, n_locals + needed_locals, 0)]) - \
+                    measure(input_path, [Command(
+                        "C_FUNCTION", name, n_locals + extra_locals, 0)])
+                if rom_budget is not None and growth + change > rom_budget:
+                    decisions.append("Not inlined " + where + ": " +
+                                     "%+d words would go over the ROM "
+                                     "budget" % change)
+                    new_body.append(command)
+                    continue
+                growth += change
+                extra_locals = needed_locals
+                decisions.append("Inlined " + where + ": %+d words" % change)
+                new_body.extend(inlined)
+            new_body[0] = Command("C_FUNCTION", name,
+                                  n_locals + extra_locals, body[0].line)
+            inlined_commands.extend(new_body)
+        inlined_program.append((input_path, inlined_commands))
+    return inlined_program, decisions
@@ -5,16 +5,114 @@ was written by Aviv Yaish. It is an extension to the specifications given
 as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
 Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
 """
+import argparse
+import concurrent.futures
+import contextlib
+import functools
+import io
 import os
-import sys
 import typing
-from Parser import Parser
-from CodeWriter import CodeWriter
+from Parser import Parser, Command, stream_commands, command_text, \
+    vm_files
+from CodeWriter import CodeWriter, CodeStrategy, TranslationOptions, \
+    BufferedOutput, RomCounter, rom_size
+from Peephole import PeepholeOptimizer
+from ObjectCache import ObjectCache
+from DeadFunctions import Program, eliminate_dead_functions
+from Inliner import inline_functions
+from SourceMap import SourceMap, Location
+from ConstantFolding import fold_commands, fold_statistics, fold_report
+from ControlFlow import simplify_control_flow, new_statistics, \
+    statistics_report
+from Superinstructions import SuperinstructionMatcher, SUPERINSTRUCTIONS, \
+    TAIL_CALLS, fired_report
+from HackEmulator import HackProgram, assemble
+from HackOutput import AssemblingOutput, write_hack, write_rom_image
+from Watcher import Watcher
+
+
+class TranslationStatistics:
+    """What the optimisations did to the files they translated. It is
+    counted during the translation itself, so it describes the code that
+    was written, after inlining and dead function removal. Files that
+    translate_incremental reuses from the cache are not counted.
+
+    Attributes:
+        folding (typing.Dict[str, int]): see
+            ConstantFolding.fold_statistics.
+        control_flow (typing.Dict[str, int]): see
+            ControlFlow.new_statistics.
+        stack_depths (typing.Dict[str, int]): the largest working stack
+            depth of every function, as the code writers track it. The 5
+            words of the frame of every call the function makes are counted
+            too.
+        superinstructions (typing.Dict[str, int]): how often every
+            superinstruction was used, see SuperinstructionMatcher.fired.
+    """
+
+    def __init__(self) -> None:
+        self.folding = fold_statistics()
+        self.control_flow = new_statistics()
+        self.stack_depths = {}
+        self.superinstructions = {}
+
+    def add_writer(self, code_writer: CodeWriter) -> None:
+        """Adds the stack depths of the functions a code writer wrote.
+
+        Args:
+            code_writer (CodeWriter): a writer that translated a file.
+        """
+        for function_name, depth in code_writer.max_stack_depth.items():
+            if function_name and \
+                    depth >= self.stack_depths.get(function_name, 0):
+                self.stack_depths[function_name] = depth
+
+    def add_matcher(
+            self, matcher: typing.Optional[SuperinstructionMatcher]) -> None:
+        """Adds the superinstructions a matcher fused.
+
+        Args:
+            matcher (SuperinstructionMatcher): the matcher of a file, or
+                None if superinstructions were not used.
+        """
+        if matcher is None:
+            return
+        for name, count in matcher.fired.items():
+            self.superinstructions[name] = \
+                self.superinstructions.get(name, 0) + count
+
+    def report(self, options: TranslationOptions) -> typing.List[str]:
+        """
+        Args:
+            options (TranslationOptions): the options of the translation.
+
+        Returns:
+            typing.List[str]: the lines of the report of every optimisation
+            the options enable.
+        """
+        lines = []
+        if options.fold_constants:
+            lines.append(fold_report(self.folding))
+        if options.simplify_flow:
+            lines.append(statistics_report(self.control_flow))
+        if options.defer_sp:
+            lines.append("Largest stack depths:")
+            for function_name, depth in sorted(
+                    self.stack_depths.items(), key=lambda item: -item[1])[:10]:
+                lines.append("    " + function_name + ": " + str(depth) +
+                             " words")
+        if options.superinstructions or options.tail_calls:
+            lines.append(fired_report(self.superinstructions))
+        return lines
 
 
 def translate_file(
         input_file: typing.TextIO, output_file: typing.TextIO,
-        bootstrap: bool) -> None:
+        bootstrap: bool,
+        options: TranslationOptions = TranslationOptions(),
+        stream: bool = False,
+        source_map: typing.Optional[SourceMap] = None,
+        statistics: typing.Optional[TranslationStatistics] = None) -> None:
     """Translates a single file.
 
     Args:
@@ -22,10 +120,22 @@ def translate_file(
         output_file (typing.TextIO): writes all output to this file.
         bootstrap (bool): if this is True, the current file is the 
             first file we are translating.
+        options (TranslationOptions): the optimisations to apply.
+        stream (bool): if this is True, the input is parsed one line at a
+            time instead of being read into memory as a whole.
+        source_map (SourceMap): if given, the command of every instruction
+            is recorded in it. It should be the output file, or write to it.
+        statistics (TranslationStatistics): if given, counts what the
+            optimisations did.
     """
     # Your code goes here!
-    parser = Parser(input_file)
-    code_writer = CodeWriter(output_file)
+    if stream:
+        parser = stream_commands(input_file)
+    else:
+        parser = Parser(input_file)
+    code_writer = CodeWriter(output_file, options.shared_calls,
+                             options.cache_top, options.defer_sp,
+                             options.strategy, statistics is not None)
     code_writer.set_file_name(input_file.name)
 
 
@@ -33,36 +143,550 @@ def translate_file(
     if bootstrap:
         code_writer.write_init()
 
-    while (parser.has_more_commands()):
-        command_type = parser.command_type()
-        if command_type in ["C_POP", "C_PUSH"]:
-            segment = parser.arg1()
-            index = parser.arg2()
-            code_writer.write_push_pop(command_type, segment, index)
-        elif command_type in ["C_ARITHMETIC"]:
-            command = parser.arg1()
-            code_writer.write_arithmetic(command)
-        elif command_type in ["C_LABEL"]:
-            label = parser.arg1()
-            code_writer.write_label(label)
-        elif command_type in ["C_IF"]:
-            label = parser.arg1()
-            code_writer.write_if(label)
-        elif command_type in ["C_GOTO"]:
-            label = parser.arg1()
-            code_writer.write_goto(label)
-        elif command_type in ["C_FUNCTION"]:
-            name = parser.arg1()
-            num = parser.arg2()
-            code_writer.write_function(name,num)
-        elif command_type in ["C_RETURN"]:
-            code_writer.write_return()
-        elif command_type in ["C_CALL"]:
-            func_name = parser.arg1()
-            n_vars = parser.arg2()
-            code_writer.write_call(func_name,n_vars)
-        parser.advance()
+    write_optimized_commands(code_writer, parser, options, source_map,
+                             statistics)
+
+
+def write_optimized_commands(
+        code_writer: CodeWriter, commands: typing.Iterable[Command],
+        options: TranslationOptions,
+        source_map: typing.Optional[SourceMap] = None,
+        statistics: typing.Optional[TranslationStatistics] = None) -> None:
+    """Runs the command passes the options enable over the commands of a
+    single file, and translates the result.
+
+    Args:
+        code_writer (CodeWriter): writes the translated commands. It has to
+            record its stack depths if statistics is given.
+        commands (typing.Iterable[Command]): the commands to translate.
+        options (TranslationOptions): the optimisations to apply.
+        source_map (SourceMap): see write_commands.
+        statistics (TranslationStatistics): if given, counts what the
+            optimisations did.
+    """
+    # nothing is counted unless statistics are asked for, so translating
+    # with --stream keeps no state for every function
+    if options.fold_constants:
+        commands = fold_commands(
+            commands, statistics.folding if statistics is not None else None)
+    if options.simplify_flow:
+        commands = simplify_control_flow(
+            commands, options.strategy.rotate_loops,
+            statistics.control_flow if statistics is not None else None)
+    matcher = superinstruction_matcher(options)
+    write_commands(code_writer, commands, options.fuse_branches, source_map,
+                   matcher)
+    if statistics is not None:
+        statistics.add_writer(code_writer)
+        statistics.add_matcher(matcher)
+
+
+def superinstruction_matcher(
+        options: TranslationOptions
+) -> typing.Optional[SuperinstructionMatcher]:
+    """
+    Args:
+        options (TranslationOptions): the matcher uses
+            Superinstructions.SUPERINSTRUCTIONS if superinstructions is on,
+            and Superinstructions.TAIL_CALLS if tail_calls is on.
+
+    Returns:
+        typing.Optional[SuperinstructionMatcher]: a matcher for the enabled
+        sequences, or None if there are none.
+    """
+    table = []
+    if options.tail_calls:
+        table += TAIL_CALLS
+    if options.superinstructions:
+        table += SUPERINSTRUCTIONS
+    if not table:
+        return None
+    return SuperinstructionMatcher(table)
+
+
+# The CodeWriter call that translates each command type.
+COMMAND_WRITERS = {
+    "C_PUSH": lambda code_writer, command: code_writer.write_push_pop(
+        command.type, command.arg1, command.arg2),
+    "C_POP": lambda code_writer, command: code_writer.write_push_pop(
+        command.type, command.arg1, command.arg2),
+    "C_ARITHMETIC": lambda code_writer, command: code_writer.write_arithmetic(
+        command.arg1),
+    "C_LABEL": lambda code_writer, command: code_writer.write_label(
+        command.arg1),
+    "C_IF": lambda code_writer, command: code_writer.write_if(command.arg1),
+    "C_GOTO": lambda code_writer, command: code_writer.write_goto(
+        command.arg1),
+    "C_FUNCTION": lambda code_writer, command: code_writer.write_function(
+        command.arg1, command.arg2),
+    "C_RETURN": lambda code_writer, command: code_writer.write_return(),
+    "C_SUPER": lambda code_writer, command: command.write(code_writer),
+    "C_CALL": lambda code_writer, command: code_writer.write_call(
+        command.arg1, command.arg2),
+}
+
+
+def command_location(code_writer: CodeWriter, command: Command) -> Location:
+    """
+    Args:
+        code_writer (CodeWriter): the writer translating the command.
+        command (Command): the command that is translated next.
+
+    Returns:
+        Location: the location of the command, for the source map.
+    """
+    function = code_writer.cur_func
+    if command.type == "C_FUNCTION":
+        function = command.arg1
+    if command.type == "C_SUPER":
+        text = "; ".join(command_text(fused) for fused in command.commands)
+    else:
+        text = command_text(command)
+    return Location(code_writer.filename + ".vm", command.line, function,
+                    text)
+
+
+def write_commands(
+        code_writer: CodeWriter, commands: typing.Iterable[Command],
+        fuse_branches: bool = False,
+        source_map: typing.Optional[SourceMap] = None,
+        superinstructions: typing.Optional[SuperinstructionMatcher] = None
+) -> None:
+    """Translates a sequence of parsed commands.
+
+    Args:
+        code_writer (CodeWriter): writes the translated commands.
+        commands (typing.Iterable[Command]): the commands to translate.
+        fuse_branches (bool): if this is True, an eq, gt or lt command that
+            is directly followed by an if-goto command, or by a not command
+            and an if-goto command, is translated into a single conditional
+            jump.
+        source_map (SourceMap): if given, every command is marked in it
+            before its code is written.
+        superinstructions (SuperinstructionMatcher): if given, the sequences
+            of commands it matches are translated as superinstructions.
+    """
+    if superinstructions is not None:
+        commands = superinstructions.fuse(code_writer, commands)
+    # an eq, gt or lt command, and maybe a not command after it, waiting to
+    # see if an if-goto follows them
+    pending_compare = []
+    for command in commands:
+        if pending_compare:
+            if command.type == "C_IF":
+                if source_map is not None:
+                    source_map.mark(command_location(code_writer, command))
+                code_writer.write_compare_if(pending_compare[0].arg1,
+                                             command.arg1,
+                                             len(pending_compare) == 2)
+                pending_compare = []
+                continue
+            if len(pending_compare) == 1 and \
+                    command.type == "C_ARITHMETIC" and command.arg1 == "not":
+                pending_compare.append(command)
+                continue
+            for waiting in pending_compare:
+                if source_map is not None:
+                    source_map.mark(command_location(code_writer, waiting))
+                code_writer.write_arithmetic(waiting.arg1)
+            pending_compare = []
+        if fuse_branches and command.type == "C_ARITHMETIC" and \
+                command.arg1 in ["eq", "gt", "lt"]:
+            pending_compare = [command]
+        else:
+            if source_map is not None:
+                source_map.mark(command_location(code_writer, command))
+            COMMAND_WRITERS[command.type](code_writer, command)
+    for waiting in pending_compare:
+        if source_map is not None:
+            source_map.mark(command_location(code_writer, waiting))
+        code_writer.write_arithmetic(waiting.arg1)
+    code_writer.write_spill()
+
+
+def translate_path(
+        input_path: str, bootstrap: bool,
+        options: TranslationOptions = TranslationOptions(),
+        stream: bool = False,
+        statistics: typing.Optional[TranslationStatistics] = None) -> str:
+    """Translates a single file into a string. Every file has its own label
+    and static namespace, so files can be translated in any order or in
+    separate processes.
+
+    Args:
+        input_path (str): path of the file to translate.
+        bootstrap (bool): if this is True, the bootstrap code is written
+            before the translated file.
+        options (TranslationOptions): see translate_file.
+        stream (bool): see translate_file.
+        statistics (TranslationStatistics): see translate_file.
+
+    Returns:
+        str: the translated assembly code.
+    """
+    output = io.StringIO()
+    with open(input_path, 'r') as input_file:
+        translate_file(input_file, output, bootstrap, options, stream,
+                       statistics=statistics)
+    return output.getvalue()
+
+
+def translate_paths(
+        input_paths: typing.List[str],
+        options: TranslationOptions = TranslationOptions(),
+        stream: bool = False, jobs: int = 1,
+        statistics: typing.Optional[TranslationStatistics] = None
+) -> typing.Iterator[str]:
+    """Translates each of the given files, without bootstrap code.
+
+    Args:
+        input_paths (typing.List[str]): paths of the .vm files to translate.
+        options (TranslationOptions): see translate_file.
+        stream (bool): see translate_file.
+        jobs (int): the number of processes translating files at the same
+            time.
+        statistics (TranslationStatistics): see translate_file. Only
+            counted when jobs is 1.
+
+    Returns:
+        typing.Iterator[str]: the assembly code of each file, in the order
+        of the input paths.
+    """
+    if jobs > 1:
+        translate_one = functools.partial(translate_path, bootstrap=False,
+                                          options=options, stream=stream)
+        with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+            yield from executor.map(translate_one, input_paths)
+    else:
+        for input_path in input_paths:
+            yield translate_path(input_path, False, options, stream,
+                                 statistics)
+
+
+def translate_files(
+        input_paths: typing.List[str], output_file: typing.TextIO,
+        options: TranslationOptions = TranslationOptions(),
+        stream: bool = False, jobs: int = 1,
+        source_map: typing.Optional[SourceMap] = None,
+        statistics: typing.Optional[TranslationStatistics] = None) -> None:
+    """Translates all the given .vm files into a single output.
+
+    Args:
+        input_paths (typing.List[str]): paths of the files to translate,
+            files without a .vm extension are skipped.
+        output_file (typing.TextIO): writes all output to this file.
+        options (TranslationOptions): the optimisations to apply. With
+            shared_calls, the shared routines are written once at the end of
+            the output.
+        stream (bool): if this is True, the files are parsed one line at a
+            time.
+        jobs (int): the number of processes translating files at the same
+            time. The output is the same for any number of jobs: the
+            bootstrap code first, then the files in the given order.
+        source_map (SourceMap): if given, the command of every instruction
+            is recorded in it. Only supported when jobs is 1.
+        statistics (TranslationStatistics): if given, counts what the
+            optimisations did. Only counted when jobs is 1.
+    """
+    input_paths = vm_files(input_paths)
+    CodeWriter(output_file, options.shared_calls,
+               strategy=options.strategy).write_init()
+    if jobs > 1:
+        for output in translate_paths(input_paths, options, stream, jobs):
+            output_file.write(output)
+    else:
+        for input_path in input_paths:
+            with open(input_path, 'r') as input_file:
+                translate_file(input_file, output_file, False, options,
+                               stream, source_map, statistics)
+    write_shared_routines(output_file, options, source_map)
+
+
+def write_shared_routines(
+        output_file: typing.TextIO, options: TranslationOptions,
+        source_map: typing.Optional[SourceMap] = None) -> None:
+    """Writes the shared $CALL and $RETURN routines if they are used.
+
+    Args:
+        output_file (typing.TextIO): writes all output to this file.
+        options (TranslationOptions): if shared_calls is off, nothing is
+            written.
+        source_map (SourceMap): if given, the routines are marked in it.
+    """
+    if not options.shared_calls:
+        return
+    if source_map is not None:
+        source_map.mark(Location("", 0, "(shared routines)", "routines"))
+    CodeWriter(output_file,
+               strategy=options.strategy).write_shared_routines()
+
+
+def translate_incremental(
+        input_paths: typing.List[str], output_file: typing.TextIO,
+        cache_dir: str, options: TranslationOptions = TranslationOptions(),
+        stream: bool = False, jobs: int = 1,
+        statistics: typing.Optional[TranslationStatistics] = None) -> int:
+    """Translates all the given .vm files into a single output, reusing the
+    object modules of files that did not change since the last build. The
+    output is the same as the output of translate_files.
+
+    Args:
+        input_paths (typing.List[str]): paths of the files to translate,
+            files without a .vm extension are skipped.
+        output_file (typing.TextIO): writes all output to this file.
+        cache_dir (str): the directory of the object modules.
+        options (TranslationOptions): see translate_files.
+        stream (bool): see translate_files.
+        jobs (int): see translate_files.
+        statistics (TranslationStatistics): see translate_files. Only the
+            files that had to be translated are counted.
+
+    Returns:
+        int: the number of files that had to be translated.
+    """
+    input_paths = vm_files(input_paths)
+    cache = ObjectCache(cache_dir)
+    keys = [cache.key(input_path, options) for input_path in input_paths]
+    changed = [index for index, key in enumerate(keys) if not cache.has(key)]
+    objects = translate_paths([input_paths[index] for index in changed],
+                              options, stream, jobs, statistics)
+    for index, assembly in zip(changed, objects):
+        cache.put(keys[index], assembly)
+    link_objects([cache.get(key) for key in keys], output_file, options)
+    cache.prune(keys)
+    return len(changed)
+
+
+def link_objects(objects: typing.List[str], output_file: typing.TextIO,
+                 options: TranslationOptions = TranslationOptions()) -> None:
+    """The link step: writes the bootstrap code, the translations of the
+    files and the shared routines.
+
+    Args:
+        objects (typing.List[str]): the translation of every file, without
+            bootstrap code, see ObjectCache.
+        output_file (typing.TextIO): writes all output to this file.
+        options (TranslationOptions): see translate_files.
+    """
+    CodeWriter(output_file, options.shared_calls,
+               strategy=options.strategy).write_init()
+    for assembly in objects:
+        output_file.write(assembly)
+    write_shared_routines(output_file, options)
+
+
+# The formats translate and the command line can write the program in.
+OUTPUT_FORMATS = ["asm", "hack", "rom"]
+
+
+def translate(sources: typing.Mapping[str, str], bootstrap: bool = True,
+              output_format: str = "asm",
+              options: TranslationOptions = TranslationOptions()
+              ) -> typing.Union[str, bytes]:
+    """Translates a program that is held in memory, without touching the
+    disk. This is the entry point for tools that translate many programs in
+    a single process: the code writers keep no state between calls, so every
+    program is translated as if it was translated on its own.
+
+    Args:
+        sources (typing.Mapping[str, str]): the text of every .vm file of
+            the program, by file name. The file names give the statics their
+            names, as the paths do for translate_files.
+        bootstrap (bool): if this is True, the bootstrap code is written
+            first, as translate_files does.
+        output_format (str): "asm" for Hack assembly, "hack" for the lines of
+            a .hack file, or "rom" for a raw ROM image of big-endian words.
+            Any other format raises a ValueError.
+        options (TranslationOptions): the optimisations to apply.
+
+    Returns:
+        typing.Union[str, bytes]: the program in the output format, bytes for
+        "rom" and text otherwise.
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError("Unknown output format " + repr(output_format) +
+                         ", expected one of " + ", ".join(OUTPUT_FORMATS))
+    output = io.StringIO()
+    output_stream = output if output_format == "asm" \
+        else AssemblingOutput()
+    if bootstrap:
+        CodeWriter(output_stream, options.shared_calls,
+                   strategy=options.strategy).write_init()
+    for name, source in sources.items():
+        input_file = io.StringIO(source)
+        input_file.name = name
+        translate_file(input_file, output_stream, False, options)
+    write_shared_routines(output_stream, options)
+    if output_format == "asm":
+        return output.getvalue()
+    if output_format == "hack":
+        write_hack(output_stream.program(), output)
+        return output.getvalue()
+    # output_format == "rom"
+    image = io.BytesIO()
+    write_rom_image(output_stream.program(), image)
+    return image.getvalue()
+
+
+def translate_batch(
+        programs: typing.Iterable[typing.Mapping[str, str]], jobs: int = 1,
+        bootstrap: bool = True, output_format: str = "asm",
+        chunk_size: int = 64,
+        options: TranslationOptions = TranslationOptions()
+) -> typing.Iterator[typing.Union[str, bytes]]:
+    """Translates many programs that are held in memory, see translate.
+
+    Args:
+        programs (typing.Iterable[typing.Mapping[str, str]]): the sources of
+            every program.
+        jobs (int): the number of processes translating programs in
+            parallel. Every process imports the translator once and
+            translates many programs.
+        bootstrap (bool): see translate.
+        output_format (str): see translate.
+        chunk_size (int): the number of programs sent to a process at once,
+            so small programs do not pay for a round trip each.
+        options (TranslationOptions): see translate.
+
+    Returns:
+        typing.Iterator[typing.Union[str, bytes]]: the translation of every
+        program, in order. An error in any program is raised when its
+        translation is reached.
+    """
+    translate_one = functools.partial(translate, bootstrap=bootstrap,
+                                      output_format=output_format,
+                                      options=options)
+    if jobs > 1:
+        with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+            yield from executor.map(translate_one, programs,
+                                    chunksize=chunk_size)
+    else:
+        for sources in programs:
+            yield translate_one(sources)
+
 
+def parse_files(input_paths: typing.List[str],
+                stream: bool = False) -> Program:
+    """Parses all the given .vm files.
+
+    Args:
+        input_paths (typing.List[str]): paths of the files to parse, files
+            without a .vm extension are skipped.
+        stream (bool): if this is True, the files are parsed one line at a
+            time, so only the commands are held in memory.
+
+    Returns:
+        Program: the path and the commands of every file.
+    """
+    program = []
+    for input_path in vm_files(input_paths):
+        with open(input_path, 'r') as input_file:
+            if stream:
+                commands = list(stream_commands(input_file))
+            else:
+                commands = Parser(input_file).commands
+        program.append((input_path, commands))
+    return program
+
+
+def translate_program(
+        program: Program, output_file: typing.TextIO,
+        options: TranslationOptions = TranslationOptions(),
+        source_map: typing.Optional[SourceMap] = None,
+        statistics: typing.Optional[TranslationStatistics] = None) -> None:
+    """Translates a parsed program into a single output, the same way
+    translate_files translates the files of the program.
+
+    Args:
+        program (Program): the path and the commands of every file.
+        output_file (typing.TextIO): writes all output to this file.
+        options (TranslationOptions): see translate_files.
+        source_map (SourceMap): see translate_files.
+        statistics (TranslationStatistics): see translate_files.
+    """
+    CodeWriter(output_file, options.shared_calls,
+               strategy=options.strategy).write_init()
+    for input_path, commands in program:
+        translate_commands(input_path, commands, output_file, options,
+                           source_map, statistics)
+    write_shared_routines(output_file, options, source_map)
+
+
+def translate_commands(
+        input_path: str, commands: typing.Iterable[Command],
+        output_file: typing.TextIO,
+        options: TranslationOptions = TranslationOptions(),
+        source_map: typing.Optional[SourceMap] = None,
+        statistics: typing.Optional[TranslationStatistics] = None) -> None:
+    """Translates the parsed commands of a single file, without bootstrap
+    code, the same way translate_file translates the file.
+
+    Args:
+        input_path (str): the path of the file the commands come from.
+        commands (typing.Iterable[Command]): the commands to translate.
+        output_file (typing.TextIO): writes all output to this file.
+        options (TranslationOptions): see translate_files.
+        source_map (SourceMap): see translate_files.
+        statistics (TranslationStatistics): see translate_files.
+    """
+    code_writer = CodeWriter(output_file, options.shared_calls,
+                             options.cache_top, options.defer_sp,
+                             options.strategy, statistics is not None)
+    code_writer.set_file_name(input_path)
+    write_optimized_commands(code_writer, commands, options, source_map,
+                             statistics)
+
+
+def commands_rom_size(
+        input_path: str, commands: typing.List[Command],
+        options: TranslationOptions = TranslationOptions()) -> int:
+    """
+    Args:
+        input_path (str): the path of the file the commands come from.
+        commands (typing.List[Command]): the commands to measure.
+        options (TranslationOptions): see translate_files.
+
+    Returns:
+        int: the ROM words taken by the translation of the commands.
+    """
+    counter = RomCounter()
+    translate_commands(input_path, commands, counter, options)
+    return counter.size
+
+
+# The options of every -O level. -O0 translates every command the way it is
+# written, -Os makes the smallest code for programs that barely fit in the
+# ROM, and -O2 the fastest code.
+OPTIMIZATION_LEVELS = {
+    "0": TranslationOptions(),
+    "s": TranslationOptions(
+        shared_calls=True, fuse_branches=True, fold_constants=True,
+        simplify_flow=True, defer_sp=True, superinstructions=True,
+        strategy=CodeStrategy(comments=False, zero_loop_locals=3,
+                              compact_frames=True)),
+    "2": TranslationOptions(
+        fuse_branches=True, fold_constants=True, simplify_flow=True,
+        defer_sp=True, superinstructions=True, tail_calls=True,
+        strategy=CodeStrategy(comments=False, compact_frames=True,
+                              rotate_loops=True)),
+}
+
+
+def memory_report(program: HackProgram) -> str:
+    """
+    Args:
+        program (HackProgram): an assembled program.
+
+    Returns:
+        str: the RAM words the assembler gives the statics and variables of
+        the program, and the size of its symbol table.
+    """
+    variables = len(program.variables)
+    used = "none" if variables == 0 else \
+        "RAM[16.." + str(15 + variables) + "]"
+    return "RAM: " + str(variables) + " words for statics and variables (" + \
+           used + "), symbol table: " + str(len(program.labels)) + \
+           " labels and " + str(variables) + " variables"
 
 
 if "__main__" == __name__:
@@ -76,25 +700,251 @@ if "__main__" == __name__:
     #     with open("FunctionCalls/SimpleFunction/SimpleFunction.vm", 'r') as input_file:
     #             translate_file(input_file, output_file, True)
 
-    if not len(sys.argv) == 2:
-        sys.exit("Invalid usage, please use: VMtranslator <input path>")
-    argument_path = os.path.abspath(sys.argv[1])
+    arg_parser = argparse.ArgumentParser(prog="VMtranslator")
+    arg_parser.add_argument("input_path")
+    arg_parser.add_argument(
+        "-O", dest="level", choices=sorted(OPTIMIZATION_LEVELS), default="0",
+        help="-O0 translates every command as it is written, -Os makes the "
+             "smallest code and -O2 the fastest. Options given on their own "
+             "are added to the ones the level turns on")
+    arg_parser.add_argument(
+        "--shared-calls", action="store_true",
+        help="use global $CALL/$RETURN routines instead of inline frames")
+    arg_parser.add_argument(
+        "--peephole", action="store_true",
+        help="run the peephole optimizer over the generated assembly")
+    arg_parser.add_argument(
+        "--fuse-branches", action="store_true",
+        help="translate eq/gt/lt followed by if-goto into a single jump")
+    arg_parser.add_argument(
+        "--fold-constants", action="store_true",
+        help="fold arithmetic on constants and remove arithmetic that does "
+             "not change its operand")
+    arg_parser.add_argument(
+        "--cache-top", action="store_true",
+        help="keep the top of the stack in the D register between commands")
+    arg_parser.add_argument(
+        "--defer-sp", action="store_true",
+        help="update SP once per basic block instead of on every push and "
+             "pop, implies --cache-top")
+    arg_parser.add_argument(
+        "--superinstructions", action="store_true",
+        help="translate common command sequences, like increments and moves "
+             "between segments, as single superinstructions")
+    arg_parser.add_argument(
+        "--tail-calls", action="store_true",
+        help="translate a call that is directly followed by a return into a "
+             "jump that reuses the frame of the current function")
+    arg_parser.add_argument(
+        "--simplify-flow", action="store_true",
+        help="thread jumps to jumps, remove unreachable code and unused "
+             "labels, and order the code of every function so gotos can fall "
+             "through")
+    arg_parser.add_argument(
+        "--stream", action="store_true",
+        help="translate line by line with a bounded output buffer, so memory "
+             "use does not grow with the input size")
+    arg_parser.add_argument(
+        "--jobs", type=int, default=1,
+        help="number of processes translating files in parallel")
+    arg_parser.add_argument(
+        "--incremental", action="store_true",
+        help="reuse the cached translation of files that did not change")
+    arg_parser.add_argument(
+        "--cache-dir", default=None,
+        help="where --incremental keeps its objects, by default a .vmcache "
+             "directory next to the output")
+    arg_parser.add_argument(
+        "--watch", action="store_true",
+        help="keep running, and retranslate the changed files of the input "
+             "directory and rewrite the output whenever a file changes")
+    arg_parser.add_argument(
+        "--watch-interval", type=float, default=0.02,
+        help="the seconds between checks of the files in --watch mode")
+    arg_parser.add_argument(
+        "--dead-functions", action="store_true",
+        help="remove the functions that Sys.init can never call")
+    arg_parser.add_argument(
+        "--inline", action="store_true",
+        help="replace calls of small functions with their commands, and "
+             "print the decision made for every call")
+    arg_parser.add_argument(
+        "--inline-budget", type=int, default=8,
+        help="the most VM commands a function --inline inlines may have")
+    arg_parser.add_argument(
+        "--rom-budget", type=int, default=None,
+        help="the most words of ROM --inline may add to the program")
+    arg_parser.add_argument(
+        "--source-map", action="store_true",
+        help="write a .map file next to the output with the VM file, line, "
+             "function and command of every instruction")
+    arg_parser.add_argument(
+        "--stats", action="store_true",
+        help="print what the enabled optimisations did: the commands "
+             "constant folding removed, the control flow changes, the "
+             "largest stack depth of every function, how often every "
+             "superinstruction was used, and the ROM size of the program "
+             "with and without shared call routines, which takes another "
+             "translation. No -O level turns this on")
+    arg_parser.add_argument(
+        "--memory-report", action="store_true",
+        help="print the RAM and symbol table space the output uses")
+    arg_parser.add_argument(
+        "--output-format", choices=OUTPUT_FORMATS, default="asm",
+        help="write Hack assembly, or assemble the program in memory and "
+             "write .hack machine code or a raw .rom image of big-endian "
+             "words")
+    arg_parser.add_argument(
+        "--dump-asm", action="store_true",
+        help="also write the .asm file when the output format is hack or "
+             "rom")
+    args = arg_parser.parse_args()
+    options = OPTIMIZATION_LEVELS[args.level]._replace(**{
+        option: True for option in TranslationOptions._fields
+        if option != "strategy" and getattr(args, option)})
+    if args.dead_functions and (args.incremental or args.jobs > 1):
+        arg_parser.error("--dead-functions translates the whole program at "
+                         "once and can not be combined with --incremental "
+                         "or --jobs")
+    if args.inline and (args.incremental or args.jobs > 1):
+        arg_parser.error("--inline translates the whole program at once and "
+                         "can not be combined with --incremental or --jobs")
+    if args.stats and args.jobs > 1:
+        arg_parser.error("--stats counts what the optimisations did while "
+                         "the files are translated and can not be combined "
+                         "with --jobs")
+    if args.source_map and (args.peephole or args.incremental or
+                            args.jobs > 1):
+        arg_parser.error("--source-map needs every instruction to be written "
+                         "in order and can not be combined with --peephole, "
+                         "--incremental or --jobs")
+    if args.watch and (args.dead_functions or args.inline or
+                       args.incremental or args.jobs > 1 or args.peephole or
+                       args.source_map or args.stats or
+                       args.output_format != "asm"):
+        arg_parser.error("--watch translates changed files on their own into "
+                         "Hack assembly and can not be combined with "
+                         "--dead-functions, --inline, --incremental, --jobs, "
+                         "--peephole, --source-map, --stats or "
+                         "--output-format")
+    argument_path = os.path.abspath(args.input_path)
+    if args.watch and not os.path.isdir(argument_path):
+        arg_parser.error("--watch needs a directory")
     if os.path.isdir(argument_path):
         files_to_translate = [
             os.path.join(argument_path, filename)
-            for filename in os.listdir(argument_path)]
+            for filename in sorted(os.listdir(argument_path))]
         output_path = os.path.join(argument_path, os.path.basename(
             argument_path))
     else:
         files_to_translate = [argument_path]
         output_path, extension = os.path.splitext(argument_path)
     output_path += ".asm"
-    bootstrap = True
-    with open(output_path, 'w') as output_file:
-        for input_path in files_to_translate:
-            filename, extension = os.path.splitext(input_path)
-            if extension.lower() != ".vm":
-                continue
-            with open(input_path, 'r') as input_file:
-                translate_file(input_file, output_file, bootstrap)
-            bootstrap = False
+    if args.watch:
+        watcher = Watcher(
+            argument_path, output_path,
+            lambda input_path, commands, output: translate_commands(
+                input_path, commands, output, options),
+            lambda objects, output: link_objects(objects, output, options))
+        try:
+            watcher.run(args.watch_interval)
+        except KeyboardInterrupt:
+            pass
+        arg_parser.exit()
+    write_asm = args.output_format == "asm" or args.dump_asm
+    assembler = None
+    with (open(output_path, 'w') if write_asm
+          else contextlib.nullcontext()) as output_file:
+        output_stream = output_file
+        if write_asm:
+            # commands are written one at a time, the file gets large chunks
+            output_stream = BufferedOutput(output_file)
+        translation_stream = output_stream
+        if args.output_format != "asm":
+            translation_stream = assembler = AssemblingOutput(output_stream)
+        if args.peephole:
+            translation_stream = PeepholeOptimizer(translation_stream)
+        source_map = None
+        if args.source_map:
+            translation_stream = source_map = SourceMap(translation_stream)
+        statistics = TranslationStatistics() if args.stats else None
+        if args.dead_functions or args.inline:
+            program = parse_files(files_to_translate, args.stream)
+            if args.inline:
+                program, decisions = inline_functions(
+                    program, lambda input_path, commands: commands_rom_size(
+                        input_path, commands, options),
+                    args.inline_budget, args.rom_budget)
+                for decision in decisions:
+                    print(decision)
+            if args.dead_functions:
+                program, removed = eliminate_dead_functions(program)
+            translate_program(program, translation_stream, options,
+                              source_map, statistics)
+            if args.dead_functions:
+                saved = 0
+                for input_path, function_name, commands in removed:
+                    size = commands_rom_size(input_path, commands, options)
+                    saved += size
+                    print("Removed " + function_name + " (" +
+                          os.path.basename(input_path) + "): " + str(size) +
+                          " words")
+                print("Removed " + str(len(removed)) + " dead functions, " +
+                      str(saved) + " words of ROM saved")
+        elif args.incremental:
+            cache_dir = args.cache_dir
+            if cache_dir is None:
+                cache_dir = os.path.join(os.path.dirname(output_path),
+                                         ".vmcache")
+            translated = translate_incremental(
+                files_to_translate, translation_stream, cache_dir, options,
+                args.stream, args.jobs, statistics)
+            print("Translated " + str(translated) + " of " +
+                  str(len(vm_files(files_to_translate))) + " files")
+        else:
+            translate_files(files_to_translate, translation_stream, options,
+                            args.stream, args.jobs, source_map, statistics)
+        if args.source_map:
+            source_map.save(os.path.splitext(output_path)[0] + ".map")
+        if args.peephole:
+            translation_stream.flush()
+            print(translation_stream.report())
+        if write_asm:
+            output_stream.flush()
+    hack_program = None
+    if assembler is not None:
+        hack_program = assembler.program()
+        binary_path = os.path.splitext(output_path)[0] + "." + \
+            args.output_format
+        if args.output_format == "hack":
+            with open(binary_path, 'w') as hack_file:
+                write_hack(hack_program, hack_file)
+        else:
+            with open(binary_path, 'wb') as rom_file:
+                write_rom_image(hack_program, rom_file)
+    if args.stats and options.shared_calls:
+        # the inline size needs a translation of its own, the shared size is
+        # the size of the output
+        inline_output = RomCounter()
+        inline_options = options._replace(shared_calls=False)
+        if args.dead_functions or args.inline:
+            translate_program(program, inline_output, inline_options)
+        else:
+            translate_files(files_to_translate, inline_output,
+                            inline_options, args.stream, args.jobs)
+        if hack_program is not None:
+            shared_size = len(hack_program.instructions)
+        else:
+            with open(output_path, 'r') as output_file:
+                shared_size = rom_size(output_file)
+        print("ROM size: " + str(inline_output.size) +
+              " words inline, " + str(shared_size) +
+              " words with shared call/return routines")
+    if args.stats:
+        for line in statistics.report(options):
+            print(line)
+    if args.memory_report:
+        if hack_program is None:
+            with open(output_path, 'r') as output_file:
+                hack_program = assemble(output_file)
+        print(memory_report(hack_program))
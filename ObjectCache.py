@@ -0,0 +1,109 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import hashlib
+import os
+import typing
+
+# The sources the translation of a file depends on. Objects made by a
+# different version of any of them are never reused.
+TRANSLATOR_SOURCES = ["Parser.py", "CodeWriter.py", "ConstantFolding.py",
+                      "ControlFlow.py", "Superinstructions.py", "Main.py"]
+
+
+def translator_version() -> str:
+    """
+    Returns:
+        str: a hash of the translator sources.
+    """
+    digest = hashlib.sha256()
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for source in TRANSLATOR_SOURCES:
+        with open(os.path.join(directory, source), 'rb') as source_file:
+            digest.update(source_file.read())
+    return digest.hexdigest()
+
+
+class ObjectCache:
+    """Stores the translation of single .vm files, the object modules.
+
+    An object module is the assembly code of one file without the bootstrap
+    code. All of its labels, statics and return addresses are symbols that
+    are local to the file, so it does not depend on the other files and the
+    objects can be linked in any combination by concatenating them. Objects
+    are keyed by a hash of the file name, its content, the translation
+    options and the translator version.
+    """
+
+    def __init__(self, directory: str) -> None:
+        """Opens the cache, creating its directory if needed.
+
+        Args:
+            directory (str): the directory holding the objects.
+        """
+        self.directory = directory
+        self.version = translator_version()
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, input_path: str, options: typing.Tuple) -> str:
+        """
+        Args:
+            input_path (str): path of a .vm file.
+            options (typing.Tuple): the options that change the translation.
+
+        Returns:
+            str: the key of the object of the file.
+        """
+        digest = hashlib.sha256()
+        digest.update(self.version.encode())
+        digest.update(repr(options).encode())
+        digest.update(os.path.basename(input_path).encode())
+        with open(input_path, 'rb') as input_file:
+            digest.update(input_file.read())
+        return digest.hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".asm")
+
+    def has(self, key: str) -> bool:
+        return os.path.exists(self.path(key))
+
+    def get(self, key: str) -> str:
+        """
+        Args:
+            key (str): the key of an object in the cache.
+
+        Returns:
+            str: the assembly code of the object.
+        """
+        with open(self.path(key), 'r') as object_file:
+            return object_file.read()
+
+    def put(self, key: str, assembly: str) -> None:
+        """Stores an object. The file is replaced atomically, so a build that
+        is interrupted never leaves a partial object behind.
+
+        Args:
+            key (str): the key of the object.
+            assembly (str): the assembly code of the object.
+        """
+        temporary_path = self.path(key) + ".tmp"
+        with open(temporary_path, 'w') as object_file:
+            object_file.write(assembly)
+        os.replace(temporary_path, self.path(key))
+
+    def prune(self, keys: typing.Iterable[str]) -> None:
+        """Removes every object except the given ones.
+
+        Args:
+            keys (typing.Iterable[str]): the keys of the objects to keep.
+        """
+        keep = set(self.path(key) for key in keys)
+        for filename in os.listdir(self.directory):
+            path = os.path.join(self.directory, filename)
+            if filename.endswith(".asm") and path not in keep:
+                os.remove(path)
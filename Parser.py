@@ -5,10 +5,138 @@ was written by Aviv Yaish. It is an extension to the specifications given
 as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
 Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
 """
+import os
+import sys
 import typing
 
 c_arithmetic = ['add', 'sub', 'eq', 'neg', 'gt', 'lt', 'and', 'or', 'not']
 
+# The command type of each first word of a VM command, any other word is
+# considered a "C_CALL".
+command_types = {"push": "C_PUSH", "pop": "C_POP", "label": "C_LABEL",
+                 "goto": "C_GOTO", "if-goto": "C_IF",
+                 "function": "C_FUNCTION", "return": "C_RETURN"}
+for _arithmetic in c_arithmetic:
+    command_types[_arithmetic] = "C_ARITHMETIC"
+
+
+class Command(typing.NamedTuple):
+    """A single tokenized VM command.
+
+    type is one of the command types returned by Parser.command_type, arg1
+    and arg2 are the values returned by Parser.arg1 and Parser.arg2. Missing
+    arguments are "" and 0. line is the number of the line of the command in
+    its file, starting at 1, or 0 if it is unknown.
+    """
+    type: str
+    arg1: str
+    arg2: int
+    line: int = 0
+
+
+# The first word of each command type, except for "C_ARITHMETIC".
+command_words = {command_type: word
+                 for word, command_type in command_types.items()
+                 if command_type != "C_ARITHMETIC"}
+command_words["C_CALL"] = "call"
+
+
+def command_text(command: Command) -> str:
+    """
+    Args:
+        command (Command): a command record.
+
+    Returns:
+        str: the command as it is written in a .vm file.
+    """
+    if command.type == "C_ARITHMETIC":
+        return command.arg1
+    if command.type == "C_RETURN":
+        return "return"
+    if command.type in ["C_LABEL", "C_GOTO", "C_IF"]:
+        return command_words[command.type] + " " + command.arg1
+    return command_words[command.type] + " " + command.arg1 + " " + \
+        str(command.arg2)
+
+
+def tokenize(line: str, line_number: int = 0) -> Command:
+    """Splits a clean VM line into a command record.
+
+    Args:
+        line (str): a VM command without comments.
+        line_number (int): the number of the line in its file.
+
+    Returns:
+        Command: the command record.
+    """
+    return tokenize_words(line.split(), line_number)
+
+
+def tokenize_words(words: typing.List[str], line_number: int = 0) -> Command:
+    """Turns the words of a VM command into a command record.
+
+    Args:
+        words (typing.List[str]): the words of a VM command.
+        line_number (int): the number of the line in its file.
+
+    Returns:
+        Command: the command record.
+    """
+    command_type = command_types.get(words[0], "C_CALL")
+    if command_type == "C_ARITHMETIC":
+        return Command(command_type, sys.intern(words[0]), 0, line_number)
+    arg1 = sys.intern(words[1]) if len(words) > 1 else ""
+    arg2 = int(words[2]) if len(words) > 2 else 0
+    return Command(command_type, arg1, arg2, line_number)
+
+
+def line_words(line: str) -> typing.List[str]:
+    """
+    Args:
+        line (str): a line of a .vm file.
+
+    Returns:
+        typing.List[str]: the words of the command of the line, without the
+        comment, or an empty list if the line has no command.
+    """
+    comment_index = line.find("//")
+    if comment_index != -1:
+        line = line[:comment_index]
+    return line.split()
+
+
+def vm_files(input_paths: typing.List[str]) -> typing.List[str]:
+    """
+    Args:
+        input_paths (typing.List[str]): paths of files.
+
+    Returns:
+        typing.List[str]: the paths with a .vm extension, in the same order.
+    """
+    return [input_path for input_path in input_paths
+            if os.path.splitext(input_path)[1].lower() == ".vm"]
+
+
+def stream_commands(
+        input_file: typing.Iterable[str]) -> typing.Iterator[Command]:
+    """Reads, cleans and tokenizes the input one line at a time. Unlike
+    Parser, this never holds more than a single line of the input in memory.
+
+    Args:
+        input_file (typing.Iterable[str]): input file, or any other source
+            of lines.
+
+    Returns:
+        typing.Iterator[Command]: the commands of the input.
+    """
+    line_number = 0
+    for line in input_file:
+        line_number += 1
+        words = line_words(line)
+        if words:
+            yield tokenize_words(words, line_number)
+
+
 class Parser:
     """
     # Parser\
@@ -56,17 +184,22 @@ class Parser:
         # Your code goes here!
         # A good place to start is to read all the lines of the input:
         # input_lines = input_file.read().splitlines()
-        self.input_lines = input_file.read().splitlines()
-        self.input_lines = self.clean_code()
+        # every line is cleaned and tokenized in a single pass
+        self.commands = []
+        for line_number, line in enumerate(input_file.read().splitlines(), 1):
+            words = line_words(line)
+            if words:
+                self.commands.append(tokenize_words(words, line_number))
         self.curindex = 0
 
+    def __iter__(self) -> typing.Iterator[Command]:
+        """
+        Returns:
+            typing.Iterator[Command]: the commands of the input, starting at
+            the current command.
+        """
+        return iter(self.commands[self.curindex:])
 
-    def print(self):
-        print(self.input_lines)
-        for line in self.input_lines:
-            print(self.command_type())
-            self.curindex += 1
-        self.curindex = 0
 
     def has_more_commands(self) -> bool:
         """Are there more commands in the input?
@@ -74,7 +207,7 @@ class Parser:
         Returns:
             bool: True if there are more commands, False otherwise.
         """
-        return self.curindex <= len(self.input_lines) - 1
+        return self.curindex <= len(self.commands) - 1
 
 
     def advance(self) -> None:
@@ -85,17 +218,6 @@ class Parser:
         # Your code goes here!
         self.curindex += 1
 
-    def clean_code(self):
-        clean_lines = []
-        for line in self.input_lines:
-            comment_index = line.find("//")
-            if(comment_index != -1):
-                line = line[:comment_index]
-                line = " ".join(line.split())
-            if line != "":
-                clean_lines.append(line)
-        return clean_lines
-
     def command_type(self) -> str:
         """
         Returns:
@@ -105,25 +227,7 @@ class Parser:
             "C_PUSH", "C_POP", "C_LABEL", "C_GOTO", "C_IF", "C_FUNCTION",
             "C_RETURN", "C_CALL".
         """
-        if self.input_lines[self.curindex].split()[0] in c_arithmetic:
-            return "C_ARITHMETIC"
-        elif self.input_lines[self.curindex].split()[0] == "push":
-            return "C_PUSH"
-        elif self.input_lines[self.curindex].split()[0] == "pop":
-            return "C_POP"
-        elif self.input_lines[self.curindex].split()[0] == "label":
-            return "C_LABEL"
-        elif self.input_lines[self.curindex].split()[0] == "goto":
-            return "C_GOTO"
-        elif self.input_lines[self.curindex].split()[0] == "if-goto":
-            return "C_IF"
-        elif self.input_lines[self.curindex].split()[0] == "function":
-            return "C_FUNCTION"
-        elif self.input_lines[self.curindex].split()[0] == "return":
-            return "C_RETURN"
-        else:
-            return "C_CALL"
-
+        return self.commands[self.curindex].type
 
     def arg1(self) -> str:
         """
@@ -132,10 +236,7 @@ class Parser:
             "C_ARITHMETIC", the command itself (add, sub, etc.) is returned. 
             Should not be called if the current command is "C_RETURN".
         """
-        if self.command_type() == "C_ARITHMETIC":
-            return self.input_lines[self.curindex]
-        else:
-            return self.input_lines[self.curindex].split()[1]
+        return self.commands[self.curindex].arg1
 
     def arg2(self) -> int:
         """
@@ -144,4 +245,4 @@ class Parser:
             called only if the current command is "C_PUSH", "C_POP", 
             "C_FUNCTION" or "C_CALL".
         """
-        return int(self.input_lines[self.curindex].split()[2])
+        return self.commands[self.curindex].arg2
@@ -0,0 +1,130 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import re
+import typing
+
+# Each rule is (name, pattern, replacement). A pattern is a list of regular
+# expressions matched against consecutive instructions, a replacement is a
+# list of instructions that may refer to the groups captured by the pattern
+# as {0}, {1}, ...
+PEEPHOLE_RULES = [
+    # @SP M=M+1 directly followed by @SP M=M-1 leaves SP as it was.
+    ("sp-increment-decrement",
+     [r"@SP", r"M=M\+1", r"@SP", r"M=M-1"],
+     ["@SP"]),
+    # A value that was just stored on top of the stack is still in D.
+    ("reload-after-store",
+     [r"@SP", r"A=M", r"M=D", r"@SP", r"A=M", r"D=M"],
+     ["@SP", "A=M", "M=D"]),
+    # A store to RAM[SP] followed by a step down to the top of the stack
+    # writes above the stack top, which is never read again.
+    ("dead-store-above-top",
+     [r"@SP", r"A=M", r"M=D", r"A=A-1"],
+     ["@SP", "A=M-1"]),
+    ("decrement-and-address",
+     [r"M=M-1", r"A=M"],
+     ["AM=M-1"]),
+    # Index 0 does not need to be added to the segment base.
+    ("zero-offset-direct",
+     [r"@0", r"D=A", r"@(\S+)", r"A=D\+A", r"D=M"],
+     ["@{0}", "D=M"]),
+    ("zero-offset-indirect",
+     [r"@0", r"D=A", r"@(\S+)", r"A=M", r"A=D\+A", r"D=M"],
+     ["@{0}", "A=M", "D=M"]),
+    ("subtract-to-address",
+     [r"D=M-D", r"A=D", r"D=M"],
+     ["A=M-D", "D=M"]),
+]
+
+
+class PeepholeOptimizer:
+    """Rewrites the Hack assembly stream written by a CodeWriter.
+
+    The optimizer is used in place of the output stream of a CodeWriter. It
+    keeps a window of the most recent instructions, and whenever an
+    instruction is added, every rule whose pattern matches the end of the
+    window replaces the matched instructions. Instructions that leave the
+    window are written to the real output stream. Labels stay in the window
+    but never match a pattern, so no rule is applied across a label.
+    Comments are dropped.
+    """
+
+    def __init__(self, output_stream: typing.TextIO,
+                 rules: typing.Optional[list] = None) -> None:
+        """Initializes the optimizer.
+
+        Args:
+            output_stream (typing.TextIO): the stream the optimized code is
+                written to.
+            rules (list): the rewrite rules, PEEPHOLE_RULES by default.
+        """
+        if rules is None:
+            rules = PEEPHOLE_RULES
+        self.output_file = output_stream
+        self.rules = [(name, [re.compile(line) for line in pattern],
+                       replacement) for name, pattern, replacement in rules]
+        self.window_size = max([len(pattern) for name, pattern, replacement
+                                in self.rules] + [1])
+        self.window = []
+        self.removed = {name: 0 for name, pattern, replacement in self.rules}
+
+    def write(self, text: str) -> None:
+        """Adds the given assembly code to the window.
+
+        Args:
+            text (str): one or more lines of assembly code.
+        """
+        for line in text.splitlines():
+            line = line.strip()
+            if line == "" or line.startswith("//"):
+                continue
+            self.window.append(line)
+            self.rewrite()
+            if len(self.window) > 2 * self.window_size:
+                extra = len(self.window) - self.window_size
+                self.output_file.write("\n".join(self.window[:extra]) + "\n")
+                del self.window[:extra]
+
+    def rewrite(self) -> None:
+        """Applies the rules to the end of the window until none matches."""
+        matched = True
+        while matched:
+            matched = False
+            for name, pattern, replacement in self.rules:
+                if len(pattern) > len(self.window):
+                    continue
+                groups = []
+                start = len(self.window) - len(pattern)
+                for regex, line in zip(pattern, self.window[start:]):
+                    match = regex.fullmatch(line)
+                    if match is None:
+                        break
+                    groups.extend(match.groups())
+                else:
+                    self.window[start:] = [line.format(*groups)
+                                           for line in replacement]
+                    self.removed[name] += len(pattern) - len(replacement)
+                    matched = True
+                    break
+
+    def flush(self) -> None:
+        """Writes the rest of the window to the output stream."""
+        if self.window:
+            self.output_file.write("\n".join(self.window) + "\n")
+            self.window = []
+
+    def report(self) -> str:
+        """
+        Returns:
+            str: how many instructions each rule removed.
+        """
+        lines = [name + ": " + str(count) + " instructions removed"
+                 for name, count in self.removed.items()]
+        lines.append("total: " + str(sum(self.removed.values())) +
+                     " instructions removed")
+        return "\n".join(lines)
@@ -0,0 +1,238 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import argparse
+import os
+import typing
+from HackEmulator import HackEmulator, assemble, load_test
+from Parser import command_types, line_words
+from SourceMap import Location, load_source_map
+
+
+class Profile:
+    """The result of a profiled run.
+
+    Attributes:
+        locations (typing.List[Location]): the source map, by address.
+        counts (typing.List[int]): the number of times every instruction ran.
+        calls (typing.Dict[str, int]): the number of calls of every function.
+        inclusive (typing.Dict[str, int]): the cycles spent in every function
+            and in the functions it called. Recursive calls are counted once,
+            by the outermost call.
+    """
+
+    def __init__(self, locations: typing.List[Location]) -> None:
+        self.locations = locations
+        self.counts = [0] * len(locations)
+        self.calls = {}
+        self.inclusive = {}
+
+    def exclusive(self) -> typing.Dict[str, int]:
+        """
+        Returns:
+            typing.Dict[str, int]: the cycles spent in the code of every
+            function itself.
+        """
+        cycles = {}
+        for location, count in zip(self.locations, self.counts):
+            if count:
+                cycles[location.function] = \
+                    cycles.get(location.function, 0) + count
+        return cycles
+
+    def lines(self) -> typing.Dict[Location, int]:
+        """
+        Returns:
+            typing.Dict[Location, int]: the cycles spent in every VM command.
+        """
+        cycles = {}
+        for location, count in zip(self.locations, self.counts):
+            if count:
+                cycles[location] = cycles.get(location, 0) + count
+        return cycles
+
+
+def ends_with_return(command: str) -> bool:
+    """
+    Args:
+        command (str): the command of a source map location. Fused commands
+            are separated by ";", see Main.command_location.
+
+    Returns:
+        bool: True if the last command is a return command.
+    """
+    words = line_words(command.split(";")[-1])
+    return bool(words) and command_types.get(words[0]) == "C_RETURN"
+
+
+def profile(emulator: HackEmulator, locations: typing.List[Location],
+            max_cycles: int) -> Profile:
+    """Runs the program like HackEmulator.run, and counts the cycles of every
+    instruction and the calls of every function.
+
+    A call is counted whenever the program reaches the first instruction of a
+    function command, and it ends when the last jump of a return command, or
+    of a tail call, runs.
+
+    Args:
+        emulator (HackEmulator): the loaded emulator.
+        locations (typing.List[Location]): the source map of its program.
+        max_cycles (int): the total number of cycles to run at most.
+
+    Returns:
+        Profile: the counts of the run.
+    """
+    result = Profile(locations)
+    instructions = emulator.program.instructions
+    entries = {}
+    returns = set()
+    for address, location in enumerate(locations):
+        if location.command.startswith("function ") and \
+                (address == 0 or locations[address - 1] != location):
+            entries[address] = location.function
+        # a tail call ("call f n; return") ends the current function with
+        # the jump at its end
+        if ends_with_return(location.command) and \
+                instructions[address].jump != "" and \
+                (address + 1 == len(locations) or
+                 locations[address + 1] != location):
+            returns.add(address)
+
+    block_counts = {}
+    stack = []
+    active = {}
+    ram = emulator.ram
+    blocks = emulator.blocks
+    halt_addresses = emulator.halt_addresses
+    size = len(blocks)
+    pc, d, a, cycles = emulator.pc, emulator.d, emulator.a, emulator.cycles
+    while cycles < max_cycles:
+        if pc >= size or pc in halt_addresses:
+            emulator.halted = True
+            break
+        if pc in entries:
+            function = entries[pc]
+            result.calls[function] = result.calls.get(function, 0) + 1
+            stack.append((function, cycles))
+            active[function] = active.get(function, 0) + 1
+        block = blocks[pc]
+        if block is None:
+            block = blocks[pc] = emulator.compile(pc)
+        if cycles + block[1] > max_cycles:
+            block = emulator.steps[pc]
+            if block is None:
+                block = emulator.steps[pc] = emulator.compile(pc, True)
+        key = (pc, block[1])
+        block_counts[key] = block_counts.get(key, 0) + 1
+        last = pc + block[1] - 1
+        pc, d, a = block[0](ram, d, a)
+        cycles += block[1]
+        if last in returns and stack:
+            function, start = stack.pop()
+            active[function] -= 1
+            if active[function] == 0:
+                result.inclusive[function] = \
+                    result.inclusive.get(function, 0) + cycles - start
+    emulator.pc, emulator.d, emulator.a, emulator.cycles = pc, d, a, cycles
+
+    # functions that are still running are charged up to the end of the run
+    while stack:
+        function, start = stack.pop()
+        active[function] -= 1
+        if active[function] == 0:
+            result.inclusive[function] = \
+                result.inclusive.get(function, 0) + cycles - start
+    for (start, length), count in block_counts.items():
+        for address in range(start, start + length):
+            result.counts[address] += count
+    return result
+
+
+def function_report(result: Profile, top: int) -> typing.List[str]:
+    """
+    Args:
+        result (Profile): the profile of a run.
+        top (int): the number of functions to list.
+
+    Returns:
+        typing.List[str]: a table of the functions with the most exclusive
+        cycles.
+    """
+    exclusive = result.exclusive()
+    total = max(sum(exclusive.values()), 1)
+    lines = ["%-32s %10s %12s %7s %12s" % ("function", "calls", "exclusive",
+                                            "%", "inclusive")]
+    for function, cycles in sorted(exclusive.items(),
+                                   key=lambda item: -item[1])[:top]:
+        lines.append("%-32s %10d %12d %6.1f%% %12d" % (
+            function, result.calls.get(function, 0), cycles,
+            100.0 * cycles / total, result.inclusive.get(function, cycles)))
+    return lines
+
+
+def line_report(result: Profile, top: int) -> typing.List[str]:
+    """
+    Args:
+        result (Profile): the profile of a run.
+        top (int): the number of VM commands to list.
+
+    Returns:
+        typing.List[str]: a table of the VM commands with the most cycles.
+    """
+    cycles_per_line = result.lines()
+    total = max(sum(cycles_per_line.values()), 1)
+    lines = ["%-24s %12s %7s  %s" % ("line", "cycles", "%", "command")]
+    for location, cycles in sorted(cycles_per_line.items(),
+                                   key=lambda item: -item[1])[:top]:
+        where = location.file + ":" + str(location.line) \
+            if location.file else location.function
+        lines.append("%-24s %12d %6.1f%%  %s" % (
+            where, cycles, 100.0 * cycles / total, location.command))
+    return lines
+
+
+if "__main__" == __name__:
+    arg_parser = argparse.ArgumentParser(prog="Profiler")
+    arg_parser.add_argument(
+        "asm_path", help="a program translated with --source-map")
+    arg_parser.add_argument(
+        "--map", default=None,
+        help="the source map, by default the .map file next to the program")
+    arg_parser.add_argument(
+        "--tst", default=None,
+        help="a CPUEmulator test script that sets up the RAM and the number "
+             "of cycles")
+    arg_parser.add_argument(
+        "--cycles", type=int, default=None,
+        help="the number of cycles to run for at most, by default the "
+             "script's or 10000000")
+    arg_parser.add_argument(
+        "--top", type=int, default=20,
+        help="the number of functions and lines to list")
+    args = arg_parser.parse_args()
+    map_path = args.map
+    if map_path is None:
+        map_path = os.path.splitext(args.asm_path)[0] + ".map"
+    if args.tst is not None:
+        emulator, max_cycles = load_test(args.tst, args.asm_path)
+    else:
+        with open(args.asm_path, 'r') as asm_file:
+            emulator = HackEmulator(assemble(asm_file))
+        max_cycles = 10000000
+    if args.cycles is not None:
+        max_cycles = args.cycles
+    source_map = load_source_map(map_path)
+    if len(source_map) != len(emulator.program.instructions):
+        arg_parser.error("the source map does not match the program, "
+                         "translate it again with --source-map")
+    result = profile(emulator, source_map, max_cycles)
+    print(args.asm_path + ": " + str(emulator.cycles) + " cycles" +
+          (", halted" if emulator.halted else ""))
+    print()
+    print("\n".join(function_report(result, args.top)))
+    print()
+    print("\n".join(line_report(result, args.top)))
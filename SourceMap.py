@@ -0,0 +1,94 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import json
+import typing
+from CodeWriter import rom_size
+
+
+class Location(typing.NamedTuple):
+    """The VM command an instruction was translated from. Code that does not
+    come from a VM command, like the bootstrap code, has an empty file name,
+    line 0 and a description in place of the function name."""
+    file: str
+    line: int
+    function: str
+    command: str
+
+
+class SourceMap:
+    """An output stream that records the VM command every instruction
+    written through it comes from.
+
+    The translator calls mark before writing the code of every command, and
+    every instruction written until the next mark is mapped to that command.
+    The map is saved as JSON, holding a list of
+    [first address, last address + 1, file, line, function, command] ranges.
+    """
+
+    def __init__(self, output_stream: typing.TextIO) -> None:
+        """Initializes the source map.
+
+        Args:
+            output_stream (typing.TextIO): the stream the code is passed on to.
+        """
+        self.output_file = output_stream
+        self.address = 0
+        self.start = 0
+        self.location = Location("", 0, "(bootstrap)", "bootstrap")
+        self.ranges = []
+
+    def mark(self, location: Location) -> None:
+        """Maps all the following instructions to the given location.
+
+        Args:
+            location (Location): the command that is translated next.
+        """
+        self.close_range()
+        self.location = location
+
+    def close_range(self) -> None:
+        if self.address > self.start:
+            self.ranges.append([self.start, self.address] +
+                               list(self.location))
+        self.start = self.address
+
+    def write(self, text: str) -> None:
+        """Writes the text to the output stream and counts its instructions.
+
+        Args:
+            text (str): the text to write.
+        """
+        self.output_file.write(text)
+        self.address += rom_size(text.splitlines())
+
+    def save(self, path: str) -> None:
+        """Writes the map to a file.
+
+        Args:
+            path (str): path of the map file.
+        """
+        self.close_range()
+        with open(path, 'w') as map_file:
+            json.dump({"ranges": self.ranges}, map_file)
+
+
+def load_source_map(path: str) -> typing.List[Location]:
+    """
+    Args:
+        path (str): path of a map file written by SourceMap.save.
+
+    Returns:
+        typing.List[Location]: the location of every instruction, by address.
+    """
+    with open(path, 'r') as map_file:
+        ranges = json.load(map_file)["ranges"]
+    locations = []
+    for start, end, file, line, function, command in ranges:
+        location = Location(file, line, function, command)
+        locations.extend([location] * (end - start))
+    return locations
@@ -0,0 +1,239 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import typing
+from Parser import Command
+from CodeWriter import CodeWriter, MAX_ADDRESS_LENGTH
+
+
+class Superinstruction(typing.NamedTuple):
+    """A sequence of VM commands that is translated as a whole.
+
+    pattern is a list of (type, arg1, arg2) templates matched against
+    consecutive commands. A template value that starts with "$" is a
+    variable: it matches any value, and every occurrence of the same variable
+    must match the same value. guard decides if the matched values can be
+    translated, and write translates them. Both are called with the code
+    writer and a dictionary of the values of the variables.
+    """
+    name: str
+    pattern: typing.List[typing.Tuple[str, typing.Any, typing.Any]]
+    guard: typing.Callable[[CodeWriter, typing.Dict], bool]
+    write: typing.Callable[[CodeWriter, typing.Dict], None]
+
+
+def can_address(code_writer: CodeWriter, segment: str, index: int) -> bool:
+    """
+    Returns:
+        bool: True if the segment entry can be written without going through
+        the stack or D.
+    """
+    return segment != "constant" and code_writer.segment_address(
+        segment, index, MAX_ADDRESS_LENGTH) is not None
+
+
+SUPERINSTRUCTIONS = [
+    # push s i, push constant c, add, pop s i
+    Superinstruction(
+        "increment",
+        [("C_PUSH", "$segment", "$index"), ("C_PUSH", "constant", "$amount"),
+         ("C_ARITHMETIC", "add", 0), ("C_POP", "$segment", "$index")],
+        lambda code_writer, values: can_address(
+            code_writer, values["segment"], values["index"]),
+        lambda code_writer, values: code_writer.write_increment(
+            values["segment"], values["index"], values["amount"])),
+    # push s i, push constant c, sub, pop s i
+    Superinstruction(
+        "decrement",
+        [("C_PUSH", "$segment", "$index"), ("C_PUSH", "constant", "$amount"),
+         ("C_ARITHMETIC", "sub", 0), ("C_POP", "$segment", "$index")],
+        lambda code_writer, values: can_address(
+            code_writer, values["segment"], values["index"]),
+        lambda code_writer, values: code_writer.write_increment(
+            values["segment"], values["index"], -values["amount"])),
+    # push s i, pop t j, like "push argument 1, pop local 0" or
+    # "push that 0, pop pointer 1"
+    Superinstruction(
+        "move",
+        [("C_PUSH", "$source", "$source_index"),
+         ("C_POP", "$target", "$target_index")],
+        lambda code_writer, values: can_address(
+            code_writer, values["target"], values["target_index"]),
+        lambda code_writer, values: code_writer.write_move(
+            values["source"], values["source_index"], values["target"],
+            values["target_index"])),
+]
+
+# call f n, return: the callee reuses the frame of the current function
+TAIL_CALLS = [
+    Superinstruction(
+        "tail-call",
+        [("C_CALL", "$function", "$n_args"), ("C_RETURN", "", 0)],
+        lambda code_writer, values: True,
+        lambda code_writer, values: code_writer.write_tail_call(
+            values["function"], values["n_args"])),
+]
+
+
+class FusedCommand(typing.NamedTuple):
+    """Consecutive commands that are translated by a superinstruction. It
+    has the fields of a Command, so it can take the place of one, with the
+    type "C_SUPER" and the superinstruction name as arg1."""
+    type: str
+    arg1: str
+    arg2: int
+    line: int
+    commands: typing.Tuple[Command, ...]
+    superinstruction: Superinstruction
+    values: typing.Dict
+
+    def write(self, code_writer: CodeWriter) -> None:
+        self.superinstruction.write(code_writer, self.values)
+
+
+def is_variable(template_value: typing.Any) -> bool:
+    """
+    Returns:
+        bool: True if the template value is a variable, see Superinstruction.
+    """
+    return isinstance(template_value, str) and template_value.startswith("$")
+
+
+def types_match(types: typing.Tuple[str, ...],
+                window: typing.List[Command]) -> bool:
+    """
+    Returns:
+        bool: False if the start of the window can not match a pattern with
+        the given command types.
+    """
+    for expected, command in zip(types, window):
+        if expected != command.type and not is_variable(expected):
+            return False
+    return True
+
+
+def bind(pattern: typing.List[typing.Tuple[str, typing.Any, typing.Any]],
+         commands: typing.List[Command]) -> typing.Optional[typing.Dict]:
+    """
+    Args:
+        pattern (typing.List): the templates of a superinstruction.
+        commands (typing.List[Command]): as many commands as the pattern has.
+
+    Returns:
+        typing.Optional[typing.Dict]: the values of the variables of the
+        pattern, or None if the commands do not match it.
+    """
+    values = {}
+    for template, command in zip(pattern, commands):
+        for expected, actual in zip(template, command[:3]):
+            if is_variable(expected):
+                if values.setdefault(expected[1:], actual) != actual:
+                    return None
+            elif expected != actual:
+                return None
+    return values
+
+
+class SuperinstructionMatcher:
+    """Replaces sequences of commands with superinstructions, and counts
+    how often each one was used."""
+
+    def __init__(self, superinstructions: typing.Optional[
+            typing.List[Superinstruction]] = None) -> None:
+        """Initializes the matcher.
+
+        Args:
+            superinstructions (typing.List[Superinstruction]): the
+                superinstructions to use, SUPERINSTRUCTIONS by default.
+                Earlier ones are tried first.
+        """
+        if superinstructions is None:
+            superinstructions = SUPERINSTRUCTIONS
+        self.superinstructions = superinstructions
+        self.max_length = max([len(superinstruction.pattern)
+                               for superinstruction in superinstructions]
+                              + [1])
+        self.fired = {superinstruction.name: 0
+                      for superinstruction in superinstructions}
+        # the superinstructions that can start with a command of each type,
+        # with the command types of their patterns, so most windows are
+        # rejected without binding the patterns
+        entries = [(superinstruction, tuple(
+                       template[0] for template in superinstruction.pattern))
+                   for superinstruction in superinstructions]
+        self.any_type = [entry for entry in entries
+                         if is_variable(entry[1][0])]
+        self.candidates = {
+            types[0]: [entry for entry in entries
+                       if entry[1][0] == types[0] or entry in self.any_type]
+            for superinstruction, types in entries}
+
+    def match(self, code_writer: CodeWriter,
+              window: typing.List[Command]) -> typing.Optional[FusedCommand]:
+        """
+        Args:
+            code_writer (CodeWriter): the writer that translates the commands.
+            window (typing.List[Command]): the next commands.
+
+        Returns:
+            typing.Optional[FusedCommand]: the first superinstruction that
+            matches the start of the window, or None.
+        """
+        for superinstruction, types in self.candidates.get(window[0].type,
+                                                           self.any_type):
+            length = len(types)
+            if length > len(window) or not types_match(types, window):
+                continue
+            values = bind(superinstruction.pattern, window[:length])
+            if values is not None and \
+                    superinstruction.guard(code_writer, values):
+                self.fired[superinstruction.name] += 1
+                return FusedCommand("C_SUPER", superinstruction.name, 0,
+                                    window[0].line, tuple(window[:length]),
+                                    superinstruction, values)
+        return None
+
+    def fuse(self, code_writer: CodeWriter,
+             commands: typing.Iterable[Command]) -> typing.Iterator:
+        """
+        Args:
+            code_writer (CodeWriter): the writer that translates the commands.
+            commands (typing.Iterable[Command]): the commands of a file.
+
+        Returns:
+            typing.Iterator: the commands, where every matched sequence is
+            replaced by a FusedCommand.
+        """
+        window = []
+        for command in commands:
+            window.append(command)
+            if len(window) >= self.max_length:
+                yield self.take(code_writer, window)
+        while window:
+            yield self.take(code_writer, window)
+
+    def take(self, code_writer: CodeWriter, window: typing.List[Command]):
+        """Removes the first command or superinstruction from the window and
+        returns it."""
+        fused = self.match(code_writer, window)
+        if fused is None:
+            return window.pop(0)
+        del window[:len(fused.commands)]
+        return fused
+
+
+def fired_report(fired: typing.Dict[str, int]) -> str:
+    """
+    Args:
+        fired (typing.Dict[str, int]): how often every superinstruction was
+            used, see SuperinstructionMatcher.fired.
+
+    Returns:
+        str: the counts, in the order the superinstructions are tried.
+    """
+    return "Superinstructions: " + (", ".join(
+        name + " " + str(count) for name, count in fired.items()) or "none")
@@ -0,0 +1,140 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import io
+import os
+import time
+import typing
+from Parser import Parser, Command, vm_files
+
+# Translates the commands of the given file into the given stream, without
+# bootstrap code.
+TranslateCommands = typing.Callable[[str, typing.List[Command],
+                                     typing.TextIO], None]
+# Writes the bootstrap code, the given translations of the files and the
+# shared routines into the given stream.
+LinkObjects = typing.Callable[[typing.List[str], typing.TextIO], None]
+
+
+class WatchedFile(typing.NamedTuple):
+    """What the watcher knows about a .vm file. stamp is the modification
+    time and the size of the file when it was read, assembly is its
+    translation, or None if it could not be translated."""
+    stamp: typing.Tuple[int, int]
+    assembly: typing.Optional[str]
+
+
+class Watcher:
+    """Keeps the translation of every .vm file of a directory in memory,
+    and rebuilds the output whenever a file changes.
+
+    Only the files that changed are parsed and translated again, the others
+    are linked from memory. The output is written to a temporary file that
+    replaces the old output at once, so it is never seen half written.
+    """
+
+    def __init__(self, directory: str, output_path: str,
+                 translate: TranslateCommands, link: LinkObjects) -> None:
+        """Initializes the watcher. Nothing is read before the first
+        rebuild.
+
+        Args:
+            directory (str): the directory of the .vm files.
+            output_path (str): the .asm file to write.
+            translate (TranslateCommands): translates a single file.
+            link (LinkObjects): links the translated files.
+        """
+        self.directory = directory
+        self.output_path = output_path
+        self.translate = translate
+        self.link = link
+        self.files = {}
+
+    def vm_paths(self) -> typing.List[str]:
+        """
+        Returns:
+            typing.List[str]: the .vm files of the directory, in the order
+            they are linked. These are the files a build of the directory
+            translates.
+        """
+        return vm_files([os.path.join(self.directory, filename)
+                         for filename in sorted(os.listdir(self.directory))])
+
+    def read(self, path: str, stamp: typing.Tuple[int, int]) -> WatchedFile:
+        """
+        Returns:
+            WatchedFile: the translated file.
+        """
+        with open(path, 'r') as input_file:
+            commands = Parser(input_file).commands
+        output = io.StringIO()
+        self.translate(path, commands, output)
+        return WatchedFile(stamp, output.getvalue())
+
+    def rebuild(self) -> typing.Optional[str]:
+        """Translates the files that changed since the last rebuild, and
+        writes the output if any file changed.
+
+        Returns:
+            typing.Optional[str]: a line describing the rebuild, or None if
+            no file changed.
+        """
+        start = time.perf_counter()
+        paths = self.vm_paths()
+        changed = []
+        errors = []
+        for path in paths:
+            try:
+                status = os.stat(path)
+            except FileNotFoundError:
+                continue
+            stamp = (status.st_mtime_ns, status.st_size)
+            known = self.files.get(path)
+            if known is not None and known.stamp == stamp:
+                continue
+            changed.append(os.path.basename(path))
+            try:
+                self.files[path] = self.read(path, stamp)
+            except (OSError, ValueError, IndexError, KeyError) as error:
+                # the file may be in the middle of being saved, it is read
+                # again when its stamp changes
+                self.files[path] = WatchedFile(stamp, None)
+                errors.append(os.path.basename(path) + ": " + repr(error))
+        removed = [path for path in self.files if path not in paths]
+        for path in removed:
+            del self.files[path]
+        if not changed and not removed:
+            return None
+        summary = str(len(changed)) + " changed, " + str(len(removed)) + \
+            " removed"
+        if any(self.files[path].assembly is None for path in self.files):
+            broken = [os.path.basename(path) for path in self.files
+                      if self.files[path].assembly is None]
+            return "Not rebuilt, " + summary + ", can not translate " + \
+                   ", ".join(broken) + \
+                   "".join("\n    " + error for error in errors)
+        temporary_path = self.output_path + ".tmp"
+        with open(temporary_path, 'w') as output_file:
+            self.link([self.files[path].assembly for path in paths
+                       if path in self.files], output_file)
+        os.replace(temporary_path, self.output_path)
+        return "Rebuilt " + os.path.basename(self.output_path) + " in " + \
+               "%.1f ms" % ((time.perf_counter() - start) * 1000) + ", " + \
+               summary
+
+    def run(self, interval: float = 0.05) -> None:
+        """Rebuilds the output whenever a file changes, until interrupted,
+        and prints a line for every rebuild.
+
+        Args:
+            interval (float): the seconds between checks of the files.
+        """
+        while True:
+            report = self.rebuild()
+            if report is not None:
+                print(time.strftime("[%H:%M:%S] ") + report, flush=True)
+            time.sleep(interval)
@@ -0,0 +1,71 @@
+"""
+Compares full and incremental builds of a synthetic project.
+
+Usage:
+    python benchmarks/incremental_build.py [--files 400] [--functions 20]
+
+Prints the time of a full translation, a cold incremental build (empty
+cache), a warm build with no changes and a warm build after one file
+changed.
+"""
+import argparse
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from Main import translate_files, translate_incremental  # noqa: E402
+from stream_memory import BLOCK  # noqa: E402
+
+
+def write_project(directory: str, files: int, functions: int) -> list:
+    """Writes a synthetic project and returns the paths of its files."""
+    paths = []
+    for index in range(files):
+        path = os.path.join(directory, "Class%d.vm" % index)
+        with open(path, "w") as output_file:
+            for function in range(functions):
+                output_file.write(BLOCK.format(index * functions + function))
+        paths.append(path)
+    return paths
+
+
+def timed(function, *args) -> float:
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--files", type=int, default=400)
+    arg_parser.add_argument("--functions", type=int, default=20)
+    args = arg_parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    cache_dir = os.path.join(directory, ".vmcache")
+    try:
+        paths = write_project(directory, args.files, args.functions)
+        full = timed(translate_files, paths, io.StringIO())
+        cold = timed(translate_incremental, paths, io.StringIO(), cache_dir)
+        warm = timed(translate_incremental, paths, io.StringIO(), cache_dir)
+        with open(paths[0], "a") as changed_file:
+            changed_file.write("push constant 1\npop temp 0\n")
+        changed = timed(translate_incremental, paths, io.StringIO(),
+                        cache_dir)
+    finally:
+        shutil.rmtree(directory)
+    print("%d files, %d functions each" % (args.files, args.functions))
+    print("%-28s %8.3f s" % ("full build", full))
+    print("%-28s %8.3f s" % ("incremental, cold cache", cold))
+    print("%-28s %8.3f s" % ("incremental, no change", warm))
+    print("%-28s %8.3f s" % ("incremental, one file changed", changed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Compares the cycles and ROM size of the stack code generation modes on the
+ProgramFlow and FunctionCalls test programs.
+
+Usage:
+    python benchmarks/stack_modes.py
+
+Every program is translated in the default mode, with --cache-top and with
+--defer-sp, run by its CPUEmulator test script in the Hack emulator and
+checked against its .cmp file.
+"""
+import io
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from CodeWriter import TranslationOptions  # noqa: E402
+from HackEmulator import run_test  # noqa: E402
+from Main import translate_file, translate_files, vm_files  # noqa: E402
+
+MODES = [("default", TranslationOptions()),
+         ("cache-top", TranslationOptions(cache_top=True)),
+         ("defer-sp", TranslationOptions(defer_sp=True))]
+
+
+def test_programs() -> list:
+    """Returns the directories of the test programs."""
+    programs = []
+    for group in ["ProgramFlow", "FunctionCalls"]:
+        group_dir = os.path.join(ROOT, group)
+        for name in sorted(os.listdir(group_dir)):
+            if os.path.exists(os.path.join(group_dir, name, name + ".tst")):
+                programs.append(os.path.join(group_dir, name))
+    return programs
+
+
+def translate(program: str, options: TranslationOptions) -> str:
+    """Translates a test program the way its test script expects it: with
+    bootstrap code if it has a Sys.vm file."""
+    paths = vm_files([os.path.join(program, filename)
+                      for filename in sorted(os.listdir(program))])
+    output = io.StringIO()
+    if any(os.path.basename(path) == "Sys.vm" for path in paths):
+        translate_files(paths, output, options)
+    else:
+        for path in paths:
+            with open(path, "r") as input_file:
+                translate_file(input_file, output, False, options)
+    return output.getvalue()
+
+
+def main() -> None:
+    print("%-20s" % "program" + "".join("%26s" % name for name, _ in MODES))
+    totals = [0] * len(MODES)
+    with tempfile.TemporaryDirectory() as directory:
+        asm_path = os.path.join(directory, "program.asm")
+        for program in test_programs():
+            name = os.path.basename(program)
+            row = "%-20s" % name
+            for index, (mode, options) in enumerate(MODES):
+                with open(asm_path, "w") as asm_file:
+                    asm_file.write(translate(program, options))
+                emulator, mismatches = run_test(
+                    os.path.join(program, name + ".tst"), asm_path)
+                totals[index] += emulator.cycles
+                row += "%26s" % ("%d cycles, %d words%s" % (
+                    emulator.cycles, len(emulator.program.instructions),
+                    " FAIL" if mismatches else ""))
+            print(row)
+    print("%-20s" % "total" + "".join("%19d cycles" % total
+                                      for total in totals))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Measures the peak memory (RSS) of translating synthetic .vm files of growing
+size, with and without the streaming mode of Main.py.
+
+Usage:
+    python benchmarks/stream_memory.py [--sizes 10M 100M 1G] [--dir DIR]
+                                       [--stream-only]
+
+Every translation runs in a fresh process, which reports its own peak RSS.
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# One function worth of VM code, repeated until the file has the wanted size.
+BLOCK = """function Bench.f{0} 2 // a synthetic function
+push argument 0
+push constant {0}
+add
+pop local 0
+label LOOP{0}
+push local 0
+push constant 1
+sub
+pop local 0
+push local 0
+push constant 0
+gt
+if-goto LOOP{0}
+push static 3
+push local 1
+call Bench.f{0} 2
+pop temp 0
+push that 1
+return
+"""
+
+
+def parse_size(text: str) -> int:
+    """Parses a size such as 10M or 1G into a number of bytes."""
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+    if text[-1].upper() in units:
+        return int(float(text[:-1]) * units[text[-1].upper()])
+    return int(text)
+
+
+def write_program(path: str, size: int) -> None:
+    """Writes a synthetic .vm file of about the given size in bytes."""
+    written = 0
+    index = 0
+    with open(path, "w") as output_file:
+        while written < size:
+            chunk = "".join(BLOCK.format(index + i) for i in range(1000))
+            output_file.write(chunk)
+            written += len(chunk)
+            index += 1000
+
+
+def peak_rss() -> int:
+    """Returns the peak RSS of this process in bytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return peak
+    return peak * 1024
+
+
+def child(input_path: str, stream: bool) -> None:
+    """Translates the input in this process and prints the peak RSS."""
+    from Main import translate_files
+    from CodeWriter import BufferedOutput
+    output_path = os.path.splitext(input_path)[0] + ".asm"
+    with open(output_path, "w") as output_file:
+        output_stream = BufferedOutput(output_file) if stream else output_file
+        translate_files([input_path], output_stream, stream=stream)
+        if stream:
+            output_stream.flush()
+    os.remove(output_path)
+    print(peak_rss())
+
+
+def measure(input_path: str, stream: bool) -> int:
+    """Returns the peak RSS of translating the input in a fresh process."""
+    command = [sys.executable, os.path.abspath(__file__), "--child",
+               input_path]
+    if stream:
+        command.append("--stream")
+    result = subprocess.run(command, check=True, stdout=subprocess.PIPE,
+                            universal_newlines=True)
+    return int(result.stdout.split()[-1])
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--sizes", nargs="+",
+                            default=["10M", "100M", "1G"])
+    arg_parser.add_argument("--dir", default=None,
+                            help="where to write the synthetic files")
+    arg_parser.add_argument("--stream-only", action="store_true",
+                            help="skip the non-streaming translation")
+    arg_parser.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    arg_parser.add_argument("--stream", action="store_true",
+                            help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+    if args.child is not None:
+        child(args.child, args.stream)
+        return
+
+    directory = args.dir or tempfile.mkdtemp()
+    print("%10s %16s %16s" % ("input", "peak RSS", "peak RSS stream"))
+    for size_text in args.sizes:
+        input_path = os.path.join(directory, "Bench.vm")
+        write_program(input_path, parse_size(size_text))
+        input_size = os.path.getsize(input_path)
+        if args.stream_only:
+            regular = "-"
+        else:
+            regular = "%.1f MB" % (measure(input_path, False) / (1 << 20))
+        streamed = "%.1f MB" % (measure(input_path, True) / (1 << 20))
+        print("%10s %16s %16s" % ("%.1f MB" % (input_size / (1 << 20)),
+                                  regular, streamed))
+        os.remove(input_path)
+
+
+if __name__ == "__main__":
+    main()
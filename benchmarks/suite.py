@@ -0,0 +1,216 @@
+"""
+Times every stage of the translation of synthetic VM programs, and writes
+the results as JSON so runs on different commits can be compared.
+
+Usage:
+    python benchmarks/suite.py [--output results.json] [--compare old.json]
+                               [--level 0] [--repeat 3] [generator options]
+
+The generator options are the ones of vm_generator.py. A program is
+generated and written to a temporary file, and then translated in stages:
+
+    read        reading the file into memory
+    clean_code  removing comments and whitespace, splitting the words
+    parse       turning the words into commands
+    codegen     translating the commands into assembly in memory
+    write       writing the assembly to a file
+
+Every stage is timed on its own, the best of the repeated runs is kept. The
+peak memory every stage allocates is measured in a separate run, since
+tracing the allocations slows the stages down.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from Parser import line_words, tokenize_words  # noqa: E402
+from CodeWriter import TranslationOptions  # noqa: E402
+from Main import OPTIMIZATION_LEVELS, translate_commands  # noqa: E402
+from vm_generator import (  # noqa: E402
+    add_config_arguments, config_from_arguments, generate)
+
+STAGES = ["read", "clean_code", "parse", "codegen", "write"]
+
+
+def run_stages(input_path: str, output_path: str,
+               options: TranslationOptions, measure) -> None:
+    """Translates the input in stages, calling measure(stage, function) to
+    run every stage, which returns the result of the function."""
+    def read() -> str:
+        with open(input_path, "r") as input_file:
+            return input_file.read()
+
+    def clean_code() -> list:
+        lines = []
+        for line_number, line in enumerate(text.splitlines(), 1):
+            words = line_words(line)
+            if words:
+                lines.append((line_number, words))
+        return lines
+
+    def parse() -> list:
+        return [tokenize_words(words, line_number)
+                for line_number, words in lines]
+
+    def codegen() -> str:
+        output = io.StringIO()
+        translate_commands(input_path, commands, output, options)
+        return output.getvalue()
+
+    def write() -> None:
+        with open(output_path, "w") as output_file:
+            output_file.write(assembly)
+
+    text = measure("read", read)
+    lines = measure("clean_code", clean_code)
+    commands = measure("parse", parse)
+    assembly = measure("codegen", codegen)
+    measure("write", write)
+
+
+def time_stages(input_path: str, output_path: str,
+                options: TranslationOptions) -> dict:
+    """Returns the seconds every stage took."""
+    seconds = {}
+
+    def measure(stage, function):
+        start = time.perf_counter()
+        result = function()
+        seconds[stage] = time.perf_counter() - start
+        return result
+
+    run_stages(input_path, output_path, options, measure)
+    return seconds
+
+
+def memory_stages(input_path: str, output_path: str,
+                  options: TranslationOptions) -> dict:
+    """Returns the peak bytes every stage allocated, on top of the memory
+    that was in use before it."""
+    peaks = {}
+
+    def measure(stage, function):
+        tracemalloc.start()
+        result = function()
+        peaks[stage] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return result
+
+    run_stages(input_path, output_path, options, measure)
+    return peaks
+
+
+def commit() -> str:
+    """Returns the current commit of the repository, or "" if unknown."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT, check=True,
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            universal_newlines=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def peak_rss() -> int:
+    """Returns the peak RSS of this process in bytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return peak
+    return peak * 1024
+
+
+def compare(results: dict, baseline: dict) -> None:
+    """Prints the change of every stage from the baseline results."""
+    print("%-12s %14s %14s %8s" % ("stage", "baseline l/s", "now l/s",
+                                   "change"))
+    for stage in STAGES + ["total"]:
+        old = baseline["stages"].get(stage)
+        new = results["stages"][stage]
+        if old is None:
+            continue
+        print("%-12s %14.0f %14.0f %+7.1f%%" % (
+            stage, old["lines_per_second"], new["lines_per_second"],
+            (new["lines_per_second"] / old["lines_per_second"] - 1) * 100))
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser()
+    add_config_arguments(arg_parser)
+    arg_parser.add_argument("--level", choices=sorted(OPTIMIZATION_LEVELS),
+                            default="0",
+                            help="the -O level to translate with")
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    arg_parser.add_argument("--output", default=None,
+                            help="where to write the JSON results")
+    arg_parser.add_argument("--compare", default=None,
+                            help="JSON results of an earlier run to compare "
+                                 "with")
+    args = arg_parser.parse_args()
+    config = config_from_arguments(args)
+    options = OPTIMIZATION_LEVELS[args.level]
+
+    directory = tempfile.mkdtemp()
+    input_path = os.path.join(directory, "Bench.vm")
+    output_path = os.path.join(directory, "Bench.asm")
+    try:
+        with open(input_path, "w") as input_file:
+            input_file.write(generate(config))
+        with open(input_path, "r") as input_file:
+            lines = sum(1 for _ in input_file)
+        runs = [time_stages(input_path, output_path, options)
+                for _ in range(args.repeat)]
+        peaks = memory_stages(input_path, output_path, options)
+    finally:
+        for path in [input_path, output_path]:
+            if os.path.exists(path):
+                os.remove(path)
+        os.rmdir(directory)
+
+    stages = {}
+    for stage in STAGES + ["total"]:
+        if stage == "total":
+            seconds = min(sum(run.values()) for run in runs)
+            peak = max(peaks.values())
+        else:
+            seconds = min(run[stage] for run in runs)
+            peak = peaks[stage]
+        stages[stage] = {"seconds": seconds,
+                         "lines_per_second": lines / seconds,
+                         "peak_bytes": peak}
+    results = {"commit": commit(),
+               "python": platform.python_version(),
+               "level": args.level,
+               "config": config._asdict(),
+               "lines": lines,
+               "stages": stages,
+               "peak_rss_bytes": peak_rss()}
+
+    print("%d lines, -O%s" % (lines, args.level))
+    print("%-12s %10s %14s %12s" % ("stage", "seconds", "lines/s",
+                                    "peak MB"))
+    for stage, result in stages.items():
+        print("%-12s %10.3f %14.0f %12.1f" % (
+            stage, result["seconds"], result["lines_per_second"],
+            result["peak_bytes"] / (1 << 20)))
+    print("peak RSS %.1f MB" % (results["peak_rss_bytes"] / (1 << 20)))
+    if args.output is not None:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+    if args.compare is not None:
+        with open(args.compare, "r") as baseline_file:
+            compare(results, json.load(baseline_file))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Measures how many VM lines per second the translator turns into assembly.
+
+Usage:
+    python benchmarks/translate_throughput.py [--lines 1000000] [--repeat 3]
+
+A synthetic program of about the given number of lines is translated in
+memory, without file I/O, in the default mode and with --cache-top and
+--defer-sp. The best of the repeated runs is printed.
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from CodeWriter import TranslationOptions  # noqa: E402
+from Main import translate_file  # noqa: E402
+from stream_memory import BLOCK  # noqa: E402
+
+MODES = [("default", TranslationOptions()),
+         ("cache-top", TranslationOptions(cache_top=True)),
+         ("defer-sp", TranslationOptions(defer_sp=True))]
+
+
+def synthetic_source(lines: int) -> str:
+    """Returns a synthetic program of at least the given number of lines."""
+    block_lines = BLOCK.count("\n")
+    return "".join(BLOCK.format(index)
+                   for index in range(-(-lines // block_lines)))
+
+
+def translate_seconds(source: str, options: TranslationOptions) -> float:
+    """Returns the time it takes to translate the source."""
+    input_file = io.StringIO(source)
+    input_file.name = "Bench.vm"
+    start = time.perf_counter()
+    translate_file(input_file, io.StringIO(), False, options)
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--lines", type=int, default=1000000)
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    args = arg_parser.parse_args()
+
+    source = synthetic_source(args.lines)
+    lines = source.count("\n")
+    print("%d lines" % lines)
+    for name, options in MODES:
+        seconds = min(translate_seconds(source, options)
+                      for _ in range(args.repeat))
+        print("%-12s %8.3f s %12.0f lines/s" % (name, seconds,
+                                                 lines / seconds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""
+Generates synthetic VM programs for the benchmarks.
+
+Usage:
+    python benchmarks/vm_generator.py OUTPUT.vm [--lines 100000] [--seed 0]
+        [--functions 100] [--call-depth 8] [--mix arithmetic=5,move=3,...]
+        [--comment-density 0.1] [--whitespace-density 0.1]
+
+The same configuration and seed always give the same program. Programs are
+valid VM code with a balanced stack in every statement, but they are made
+to be translated, not run: loops never end and calls are not checked.
+"""
+import argparse
+import random
+import typing
+
+SEGMENTS = ["local", "argument", "this", "that", "static", "temp"]
+BINARY = ["add", "sub", "and", "or", "eq", "gt", "lt"]
+UNARY = ["neg", "not"]
+COMMENTS = ["// a comment", "// TODO: check the bounds",
+            "// the loop counter", "//"]
+
+
+class GeneratorConfig(typing.NamedTuple):
+    """The shape of a generated program."""
+    # about how many lines the program has, comments and blank lines included
+    lines: int = 100000
+    # the number of functions, the lines are split between them evenly
+    functions: int = 100
+    # function i only calls functions of the next level, i % call_depth + 1,
+    # so chains of calls are at most this deep
+    call_depth: int = 8
+    # the relative weights of the kinds of statements: push/push/op/pop
+    # arithmetic, push/pop moves, branches and calls
+    mix: typing.Tuple[typing.Tuple[str, float], ...] = (
+        ("arithmetic", 5.0), ("move", 3.0), ("branch", 1.0), ("call", 1.0))
+    # the fraction of commands followed by a comment, there are half as many
+    # lines that are only a comment
+    comment_density: float = 0.1
+    # the fraction of commands with extra spaces and tabs around and between
+    # their words, there are half as many blank lines
+    whitespace_density: float = 0.1
+    seed: int = 0
+
+
+class ProgramGenerator:
+    """Writes the statements of a program one at a time."""
+
+    def __init__(self, config: GeneratorConfig) -> None:
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.kinds = [kind for kind, weight in config.mix]
+        self.weights = [weight for kind, weight in config.mix]
+        self.labels = 0
+
+    def segment_entry(self) -> str:
+        segment = self.random.choice(SEGMENTS)
+        return segment + " " + str(self.random.randrange(
+            8 if segment == "temp" else 16))
+
+    def statement(self, function: int) -> typing.List[str]:
+        """
+        Returns:
+            typing.List[str]: the commands of a random statement of the
+            given function.
+        """
+        kind = self.random.choices(self.kinds, self.weights)[0]
+        if kind == "arithmetic":
+            commands = ["push " + self.segment_entry(),
+                        "push constant " + str(self.random.randrange(32768))]
+            commands.append(self.random.choice(BINARY))
+            if self.random.random() < 0.3:
+                commands.append(self.random.choice(UNARY))
+            return commands + ["pop " + self.segment_entry()]
+        if kind == "move":
+            return ["push " + self.segment_entry(),
+                    "pop " + self.segment_entry()]
+        if kind == "branch":
+            self.labels += 1
+            label = "L" + str(self.labels)
+            return ["label " + label, "push " + self.segment_entry(),
+                    "push constant 0", self.random.choice(["eq", "gt", "lt"]),
+                    "if-goto " + label]
+        depth = self.config.call_depth
+        level = function % depth + 1
+        callees = list(range(level, self.config.functions, depth))
+        if level >= depth or not callees:
+            return ["push constant 1", "pop temp 0"]
+        n_args = self.random.randrange(4)
+        return ["push " + self.segment_entry() for _ in range(n_args)] + \
+               ["call Bench.f" + str(self.random.choice(callees)) + " " +
+                str(n_args), "pop temp 0"]
+
+    def decorate(self, command: str) -> str:
+        """Adds the comments and the whitespace of the configuration to a
+        command."""
+        if self.random.random() < self.config.whitespace_density:
+            command = "\t" + command.replace(" ", "  \t") + "   "
+        if self.random.random() < self.config.comment_density:
+            command += " " + self.random.choice(COMMENTS)
+        return command
+
+    def lines(self) -> typing.Iterator[str]:
+        """
+        Returns:
+            typing.Iterator[str]: the lines of the program.
+        """
+        config = self.config
+        per_function = max(config.lines // max(config.functions, 1), 4)
+        blank_density = (config.comment_density +
+                         config.whitespace_density) / 2
+        for function in range(config.functions):
+            yield "function Bench.f" + str(function) + " 4"
+            written = 2
+            while written < per_function:
+                roll = self.random.random()
+                if roll < config.comment_density / 2:
+                    yield self.random.choice(COMMENTS)
+                    written += 1
+                    continue
+                if roll < blank_density:
+                    yield ""
+                    written += 1
+                    continue
+                for command in self.statement(function):
+                    yield self.decorate(command)
+                    written += 1
+            yield "push constant 0"
+            yield "return"
+
+
+def generate(config: GeneratorConfig) -> str:
+    """
+    Returns:
+        str: the text of a program of the given shape.
+    """
+    return "".join(line + "\n" for line in ProgramGenerator(config).lines())
+
+
+def parse_mix(text: str) -> typing.Tuple[typing.Tuple[str, float], ...]:
+    """Parses a mix such as "arithmetic=5,move=3,branch=1,call=1"."""
+    mix = []
+    for item in text.split(","):
+        kind, weight = item.split("=")
+        mix.append((kind, float(weight)))
+    return tuple(mix)
+
+
+def add_config_arguments(arg_parser: argparse.ArgumentParser) -> None:
+    """Adds the fields of GeneratorConfig to a command line parser."""
+    default = GeneratorConfig()
+    arg_parser.add_argument("--lines", type=int, default=default.lines)
+    arg_parser.add_argument("--functions", type=int,
+                            default=default.functions)
+    arg_parser.add_argument("--call-depth", type=int,
+                            default=default.call_depth)
+    arg_parser.add_argument(
+        "--mix", type=parse_mix, default=default.mix,
+        help="weights of the statement kinds, like "
+             "arithmetic=5,move=3,branch=1,call=1")
+    arg_parser.add_argument("--comment-density", type=float,
+                            default=default.comment_density)
+    arg_parser.add_argument("--whitespace-density", type=float,
+                            default=default.whitespace_density)
+    arg_parser.add_argument("--seed", type=int, default=default.seed)
+
+
+def config_from_arguments(args: argparse.Namespace) -> GeneratorConfig:
+    return GeneratorConfig(
+        lines=args.lines, functions=args.functions,
+        call_depth=args.call_depth, mix=args.mix,
+        comment_density=args.comment_density,
+        whitespace_density=args.whitespace_density, seed=args.seed)
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("output_path")
+    add_config_arguments(arg_parser)
+    args = arg_parser.parse_args()
+    with open(args.output_path, "w") as output_file:
+        output_file.write(generate(config_from_arguments(args)))
+
+
+if __name__ == "__main__":
+    main()
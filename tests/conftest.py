@@ -0,0 +1,9 @@
+"""
+Lets the tests import the translator modules from the root of the
+repository, the way the benchmarks do.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
@@ -0,0 +1,54 @@
+"""
+Checks that folded comparisons give the same result as the code the
+translator writes for them, including when x-y overflows.
+"""
+import itertools
+
+from CodeWriter import TranslationOptions
+from ConstantFolding import fold_commands
+from HackEmulator import HackEmulator, assemble, to_signed
+from Main import translate
+from Parser import tokenize
+
+# VM commands that push values near the ends of the 16 bit range.
+OPERANDS = {
+    32767: ["push constant 32767"],
+    32766: ["push constant 32766"],
+    5: ["push constant 5"],
+    0: ["push constant 0"],
+    -1: ["push constant 1", "neg"],
+    -5: ["push constant 5", "neg"],
+    -32767: ["push constant 32767", "neg"],
+    -32768: ["push constant 32767", "neg", "push constant 1", "sub"],
+}
+
+
+def run(source: str, options: TranslationOptions) -> int:
+    """Translates and runs a program that pops its result to temp 0, and
+    returns the result."""
+    emulator = HackEmulator(assemble(
+        translate({"Test.vm": source}, False, options=options).splitlines()))
+    emulator.ram[0] = 256
+    emulator.run(10000)
+    assert emulator.halted
+    return to_signed(emulator.ram[5])
+
+
+def test_folded_comparisons_match_the_translated_code():
+    for (x, left), (y, right), command in itertools.product(
+            OPERANDS.items(), OPERANDS.items(), ["eq", "gt", "lt"]):
+        source = "\n".join(left + right + [command, "pop temp 0"])
+        folded = list(fold_commands(
+            tokenize(line) for line in source.splitlines()))
+        assert command not in [folded_command.arg1
+                               for folded_command in folded], source
+        expected = run(source, TranslationOptions())
+        assert run(source, TranslationOptions(fold_constants=True)) == \
+            expected, (x, command, y)
+
+
+def test_gt_follows_the_wrapped_difference():
+    # 32767 - (-5) overflows to a negative difference, so gt is false
+    source = "push constant 32767\npush constant 5\nneg\ngt\npop temp 0\n"
+    assert run(source, TranslationOptions()) == 0
+    assert run(source, TranslationOptions(fold_constants=True)) == 0
@@ -0,0 +1,10 @@
+from Profiler import ends_with_return
+
+
+def test_ends_with_return():
+    assert ends_with_return("return")
+    assert ends_with_return("return // done")
+    assert ends_with_return("call Main.f 2; return")
+    assert not ends_with_return("label no_return")
+    assert not ends_with_return("goto after_return")
+    assert not ends_with_return("push constant 1")
@@ -0,0 +1,48 @@
+"""
+Checks that translating with --stream keeps no state for every function,
+unless statistics are asked for.
+"""
+import io
+
+import Main
+from CodeWriter import CodeWriter
+
+SOURCE = "".join("function Test.f" + str(index) + " 0\n"
+                 "push constant 1\n"
+                 "push constant 2\n"
+                 "add\n"
+                 "return\n" for index in range(100))
+
+
+def translate_writers(monkeypatch, statistics):
+    """Translates SOURCE at -O2 with stream=True, and returns the code
+    writers that translated it."""
+    writers = []
+
+    class RecordingWriter(CodeWriter):
+        def __init__(self, *args, **kwargs) -> None:
+            super().__init__(*args, **kwargs)
+            writers.append(self)
+
+    monkeypatch.setattr(Main, "CodeWriter", RecordingWriter)
+    input_file = io.StringIO(SOURCE)
+    input_file.name = "Test.vm"
+    Main.translate_file(input_file, io.StringIO(), False,
+                        Main.OPTIMIZATION_LEVELS["2"], stream=True,
+                        statistics=statistics)
+    return writers
+
+
+def test_stream_without_statistics_keeps_no_function_state(monkeypatch):
+    writers = translate_writers(monkeypatch, None)
+    assert writers
+    for writer in writers:
+        assert writer.max_stack_depth is None
+
+
+def test_statistics_record_every_function(monkeypatch):
+    statistics = Main.TranslationStatistics()
+    translate_writers(monkeypatch, statistics)
+    assert len(statistics.stack_depths) == 100
+    # -O2 folds the two pushes and the add into a single push
+    assert statistics.stack_depths["Test.f0"] == 1
@@ -0,0 +1,22 @@
+"""
+Checks the output formats of the in-memory translate API.
+"""
+import pytest
+
+from Main import translate
+
+SOURCES = {"Test.vm": "push constant 1\npop temp 0\n"}
+
+
+def test_output_formats_hold_the_same_program():
+    assert "@SP" in translate(SOURCES, False)
+    words = translate(SOURCES, False, "hack").splitlines()
+    assert all(len(word) == 16 and set(word) <= {"0", "1"}
+               for word in words)
+    assert translate(SOURCES, False, "rom") == b"".join(
+        int(word, 2).to_bytes(2, "big") for word in words)
+
+
+def test_unknown_output_format_is_an_error():
+    with pytest.raises(ValueError):
+        translate(SOURCES, False, "hak")